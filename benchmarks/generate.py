@@ -0,0 +1,91 @@
+"""
+Writes synthetic logs with the same layout as those of netket.logging.JsonLog.
+
+    python benchmarks/generate.py out.log --iters 10000 --observables 20
+"""
+import argparse
+
+import numpy as np
+
+import orjson
+
+
+def _column(rng, n, gap_fraction, scale=1.0, offset=0.0):
+    values = (offset + scale * rng.normal(size=n)).tolist()
+    if gap_fraction > 0:
+        for i in np.flatnonzero(rng.random(n) < gap_fraction):
+            values[i] = None
+    return values
+
+
+def make_log(n_iters, n_observables, n_complex=None, gap_fraction=0.0, seed=0):
+    """
+    Returns a dictionary laid out like a JsonLog, with `n_observables`
+    statistics blocks (Mean, Variance, Sigma, R_hat, TauCorr) logged for
+    `n_iters` iterations, plus the sampler acceptance.
+
+    The Mean of the first `n_complex` observables (half of them by default)
+    is complex and stored as a real/imag dictionary. A fraction
+    `gap_fraction` of the entries of every column is replaced by None, as
+    NetKet does for NaNs.
+    """
+    rng = np.random.default_rng(seed)
+    if n_complex is None:
+        n_complex = n_observables // 2
+
+    iters = list(range(n_iters))
+
+    def column(**kwargs):
+        return _column(rng, n_iters, gap_fraction, **kwargs)
+
+    data = {}
+    for i in range(n_observables):
+        if i < n_complex:
+            mean = {"real": column(offset=-10.0), "imag": column(scale=1e-3)}
+        else:
+            mean = column(offset=-10.0)
+
+        data[f"obs_{i}"] = {
+            "iters": iters,
+            "Mean": mean,
+            "Variance": column(offset=1.0, scale=0.1),
+            "Sigma": column(offset=0.01, scale=1e-3),
+            "R_hat": column(offset=1.0, scale=1e-3),
+            "TauCorr": column(offset=0.5, scale=0.1),
+        }
+
+    data["acceptance"] = {"iters": iters, "value": column(offset=0.5, scale=0.1)}
+    return data
+
+
+def write_log(path, *args, **kwargs):
+    """Writes the log returned by make_log to `path`, returning its size in bytes."""
+    raw = orjson.dumps(make_log(*args, **kwargs))
+    with open(path, "wb") as f:
+        f.write(raw)
+    return len(raw)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path")
+    parser.add_argument("--iters", type=int, default=10_000)
+    parser.add_argument("--observables", type=int, default=20)
+    parser.add_argument("--complex", type=int, default=None)
+    parser.add_argument("--gaps", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    size = write_log(
+        args.path,
+        args.iters,
+        args.observables,
+        n_complex=args.complex,
+        gap_fraction=args.gaps,
+        seed=args.seed,
+    )
+    print(f"Wrote {args.path} ({size / 2**20:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Benchmarks the load and render hot paths of nkshow on synthetic logs.
+
+    python benchmarks/run.py --tiers small medium --output results.json
+
+Results are written as JSON, with one record per benchmark and size tier,
+so that they can be compared across commits.
+"""
+import argparse
+import io
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import orjson
+
+from generate import write_log
+
+from rich.console import Console
+
+from nkshow.database.database import Database
+from nkshow.database.loading import loadfile, transform, collect_history
+from nkshow.database.streaming import loadstream
+from nkshow.widgets.plot import PlotextMixin
+from nkshow.widgets.table_view import HistoryRows
+
+
+# name -> (iterations, observables)
+TIERS = {
+    "small": (1_000, 5),
+    "medium": (10_000, 20),
+    "large": (100_000, 20),
+    "huge": (1_000_000, 5),
+}
+
+PLOT_SIZE = (200, 50)
+TABLE_ROWS = 50
+
+
+def measure(fun, setup=None, repeat=5, number=1):
+    """
+    Runs `fun(setup())` `number` times for each of `repeat` rounds, and
+    returns the per-call times of every round. setup is not timed.
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fun(arg)
+        times.append((time.perf_counter() - t0) / number)
+    return times
+
+
+def bench_tier(name, n_iters, n_observables, workdir, repeat):
+    path = os.path.join(workdir, f"{name}.log")
+    n_bytes = write_log(path, n_iters, n_observables, gap_fraction=0.01)
+    with open(path, "rb") as f:
+        raw_bytes = f.read()
+
+    results = {}
+
+    results["loadfile"] = measure(lambda _: loadfile(path), repeat=repeat)
+
+    results["loadstream"] = measure(lambda _: loadstream(path), repeat=repeat)
+
+    results["transform"] = measure(
+        lambda raw: transform(raw), setup=lambda: orjson.loads(raw_bytes), repeat=repeat
+    )
+
+    # collect_history pops the iterations from the tree, so it needs a fresh one
+    results["collect_history"] = measure(
+        lambda tree: collect_history(tree),
+        setup=lambda: transform(orjson.loads(raw_bytes)),
+        repeat=repeat,
+    )
+
+    def new_database():
+        db = Database(cache=None, memory_budget=None)
+        db.load_file(path)
+        return db
+
+    results["Database.get_data (first access)"] = measure(
+        lambda db: db.get_data(path, "obs_0"), setup=new_database, repeat=repeat
+    )
+
+    db = new_database()
+    db.get_data(path, "obs_0")
+    results["Database.get_data"] = measure(
+        lambda _: db.get_data(path, "obs_0"), repeat=repeat, number=1000
+    )
+
+    hist = db.get_data(path, "obs_0")
+
+    def make_plot(plot):
+        plot.make_plot(*PLOT_SIZE)
+
+    def new_plot():
+        plot = PlotextMixin()
+        plot.data = [(hist["iters"], hist["Mean"], "obs_0/Mean")]
+        return plot
+
+    results["PlotextMixin.make_plot (first)"] = measure(
+        make_plot, setup=new_plot, repeat=repeat
+    )
+
+    plot = new_plot()
+    plot.make_plot(*PLOT_SIZE)
+    results["PlotextMixin.make_plot"] = measure(lambda _: make_plot(plot), repeat=repeat)
+
+    # What TableView.show_data and the following render cost
+    console = Console(file=io.StringIO(), width=PLOT_SIZE[0])
+
+    def show_data(_):
+        rows = HistoryRows(db.get_data(path, "obs_0"), "obs_0")
+        console.print(rows.render_window(n_iters // 2, TABLE_ROWS))
+
+    results["TableView.show_data"] = measure(show_data, repeat=repeat)
+
+    os.remove(path)
+
+    return [
+        {
+            "benchmark": bench,
+            "tier": name,
+            "iters": n_iters,
+            "observables": n_observables,
+            "file_bytes": n_bytes,
+            "repeat": len(times),
+            "min": min(times),
+            "median": statistics.median(times),
+            "max": max(times),
+        }
+        for bench, times in results.items()
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tiers", nargs="+", default=["small", "medium"], choices=TIERS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="defaults to stdout")
+    args = parser.parse_args()
+
+    records = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for tier in args.tiers:
+            print(f"Running tier {tier}...", file=sys.stderr)
+            records.extend(bench_tier(tier, *TIERS[tier], workdir, args.repeat))
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+        },
+        "results": records,
+    }
+
+    out = orjson.dumps(report, option=orjson.OPT_INDENT_2)
+    if args.output is None:
+        sys.stdout.buffer.write(out + b"\n")
+    else:
+        with open(args.output, "wb") as f:
+            f.write(out)
+
+
+if __name__ == "__main__":
+    main()
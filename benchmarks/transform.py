@@ -0,0 +1,85 @@
+"""
+Compares the columnar `transform` in nkshow.database.loading with the
+previous element-by-element implementation.
+
+    python benchmarks/transform.py --iters 100000 --observables 30
+"""
+import argparse
+import itertools
+import time
+from numbers import Number
+
+import numpy as np
+
+from nkshow.database.loading import transform
+
+from generate import make_log
+
+
+# %% Reference implementation, as it was before the columnar engine
+
+
+def _all_equal(x):
+    g = itertools.groupby(x)
+    return next(g, True) and not next(g, False)
+
+
+def _is_leaf(x):
+    if isinstance(x, list) and len(x) > 0:
+        if isinstance(x[0], Number):
+            return _all_equal(type(xi) for xi in x)
+        elif isinstance(x[0], type(None)):
+            return _all_equal(type(xi) for xi in x)
+    return False
+
+
+def transform_reference(x):
+    if _is_leaf(x):
+        if x[0] == None:
+            return np.full(len(x), np.nan)
+        else:
+            return np.array(x)
+    elif isinstance(x, (list, tuple)):
+        return {f"{i}": transform_reference(xi) for i, xi in enumerate(x)}
+    elif isinstance(x, dict):
+        res = {k: transform_reference(v) for k, v in x.items()}
+        if len(res) == 2 and set(x.keys()) == set(("real", "imag")):
+            return res["real"] + 1j * res["imag"]
+        else:
+            return res
+    else:
+        raise ValueError(f"Unknown type: {type(x)}")
+
+
+# %%
+
+
+def timeit(fun, data, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fun(data)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iters", type=int, default=100_000)
+    parser.add_argument("--observables", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_log(args.iters, args.observables)
+
+    t_ref = timeit(transform_reference, data, args.repeat)
+    t_new = timeit(transform, data, args.repeat)
+
+    print(f"iters={args.iters} observables={args.observables}")
+    print(f"reference: {t_ref*1000:.1f} ms")
+    print(f"columnar:  {t_new*1000:.1f} ms")
+    print(f"speedup:   {t_ref/t_new:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
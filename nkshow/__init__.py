@@ -1,9 +1,26 @@
-from .app import MyApp
+import sys
 
 from ._version import version as __version__
 
 
+def __getattr__(name):
+    # The app is imported lazily, so that the headless commands do not
+    # import textual
+    if name == "MyApp":
+        from .app import MyApp
+
+        return MyApp
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def run():
+    if len(sys.argv) > 1 and sys.argv[1] == "query":
+        from .query import main
+
+        return main(sys.argv[2:])
+
+    from .app import MyApp
+
     # Run our app class
     MyApp.run(title="Netket Visualizer", log="nkshow.debuglog")
 
@@ -20,8 +20,11 @@ from .widgets import (
     TableView,
     PlotPanel,
     PlotController,
+    StatsPanel,
+    scheduler,
 )
 from .database import data as database
+from . import instrumentation
 
 
 class MyApp(App):
@@ -33,6 +36,14 @@ class MyApp(App):
         # Bind our basic keys
         await self.bind("b", "view.toggle('sidebar')", "Toggle sidebar")
         await self.bind("c", "clear_plot()", "Clear Plot Panels")
+        await self.bind("a", "toggle_aggregate()", "Aggregate runs")
+        await self.bind("g", "cycle_aggregate_band()", "Aggregate band")
+        await self.bind("e", "toggle_error_bands()", "Error bands")
+        await self.bind("s", "toggle_stats()", "Toggle timings")
+        await self.bind("f", "filter_key()", "Filter by key")
+        await self.bind("m", "cycle_smoothing()", "Smoothing")
+        await self.bind("]", "scale_window(2)", "Wider window")
+        await self.bind("[", "scale_window(0.5)", "Narrower window")
         await self.bind("q", "quit", "Quit")
 
         # Get path to show
@@ -44,6 +55,9 @@ class MyApp(App):
     async def on_mount(self) -> None:
         """Call after terminal goes in to application mode"""
 
+        # redraws requested from the file watcher thread run on this loop
+        scheduler.attach()
+
         # Create our widgets
         # In this a scroll view for the code and a directory tree
         self.directory = DirectoryTree(self.path)
@@ -51,7 +65,11 @@ class MyApp(App):
         self.plotview = PlotPanel(name="Plot panel")
         self.inspector = TableView()
 
+        self.stats = StatsPanel(name="stats")
+        self.stats.visible = False
+
         await self.view.dock(Header(), edge="top")
+        await self.view.dock(self.stats, edge="bottom", size=12, name="stats")
         grid = await self.view.dock_grid(edge="left", name="left")
         await self.view.dock(Footer(), edge="bottom")
         grid.add_column(name="left", size=48)
@@ -76,11 +94,14 @@ class MyApp(App):
 
         self._selected = []
         self._data = None
+        # the key path last clicked, used by filter_key
+        self._key = None
 
     async def handle_json_click(self, message: JsonClick) -> None:
         """A message sent by the directory tree when a file is clicked."""
 
         log(f"GOT message {message}")
+        self._key = message.path
         await self.inspector.show_data(message.file, message.path)
         log(f" ->  updated inspector with {message}")
         await self.plotview.set_plot_data(
@@ -110,6 +131,51 @@ class MyApp(App):
                 message.file, message.path, "iters", "Mean"
             )
 
+    async def action_toggle_error_bands(self) -> None:
+        await self.plotview.toggle_error_bands()
+
+    async def action_toggle_aggregate(self) -> None:
+        await self.plotview.toggle_aggregate()
+
+    async def action_cycle_aggregate_band(self) -> None:
+        await self.plotview.cycle_aggregate_band()
+        self.app.sub_title = f"aggregate band: {self.plotview.aggregate_band}"
+
+    async def action_cycle_smoothing(self) -> None:
+        await self.plotview.cycle_smoothing()
+        self.show_smoothing()
+
+    async def action_scale_window(self, factor) -> None:
+        await self.plotview.scale_window(factor)
+        self.show_smoothing()
+
+    def show_smoothing(self):
+        smoothing = self.plotview.smoothing
+        if smoothing.mode is None:
+            self.app.sub_title = "no smoothing"
+        else:
+            self.app.sub_title = f"{smoothing.mode} over {smoothing.window} iterations"
+
+    async def action_toggle_stats(self) -> None:
+        # timings are only recorded while they are shown
+        self.stats.visible = not self.stats.visible
+        instrumentation.enable(self.stats.visible)
+
+    async def action_filter_key(self) -> None:
+        """Shows only the logs with the key last clicked, or all of them again."""
+        if self.directory.filter is not None:
+            await self.directory.set_filter(None)
+            self.app.sub_title = ""
+        elif self._key is not None:
+            n = await self.directory.set_filter(self._key)
+            builder = self.directory.index_builder
+            status = f"{self._key}: {n} logs"
+            if builder.failed is not None:
+                status += " (indexing failed, see the log)"
+            elif builder.n_queued > 0:
+                status += f" ({builder.n_queued} being indexed)"
+            self.app.sub_title = status
+
     async def action_clear_plot(self) -> None:
         log(f"GOT ACTION clear plot")
         await self.directory.clear_activated()
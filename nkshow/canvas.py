@@ -0,0 +1,52 @@
+"""
+Plotext canvases, built in the worker processes of the render pool. This
+module must not import the widgets, whose file watchers would be started
+in every worker.
+"""
+from rich.ansi import AnsiDecoder
+
+import plotext as plt
+
+try:
+    # a figure of its own, instead of the global one of the plotext module
+    from plotext._figure import _figure_class
+except ImportError:
+    _figure_class = None
+
+
+def _figure():
+    if _figure_class is None:
+        # not reentrant, but the render pool uses one process per canvas
+        plt.clf()
+        plt.limitsize(False, False)
+        return plt
+    fig = _figure_class()
+    # by default the figure is not allowed to be larger than the terminal
+    if hasattr(fig, "_limit_master_size"):
+        fig._limit_master_size(False, False)
+    return fig
+
+
+def build_canvas(series, bands, width, height, title="", xlim=None, ylim=None):
+    """
+    The plotext canvas, as ANSI text, of the (x, y, label) `series` over the
+    (x, y) `bands`, drawn on a figure of its own when plotext allows it.
+    """
+    fig = _figure()
+    for (x, y) in bands:
+        fig.plot(x, y, marker="dot", color="gray")
+    for (x, y, label) in series:
+        fig.plot(x, y, label=label)
+    fig.plotsize(width, height)
+    fig.title(title)
+    fig.theme("dark")
+    if xlim is not None:
+        fig.xlim(*xlim)
+    if ylim is not None:
+        fig.ylim(*ylim)
+    return fig.build()
+
+
+def render_lines(spec):
+    """The lines of rich Text of the canvas built by build_canvas(**spec)."""
+    return list(AnsiDecoder().decode(build_canvas(**spec)))
@@ -1,3 +1,8 @@
 from .database import Database
+from .history import History
+from .aggregate import Aggregate
+from .index import KeyIndex, IndexBuilder
+from .smoothing import Smoothing, Rolling
 
 data = Database()
+key_index = KeyIndex()
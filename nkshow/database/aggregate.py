@@ -0,0 +1,242 @@
+import numpy as np
+
+from ..instrumentation import timed
+
+# %%
+
+
+def column_stats(values, quantiles=()):
+    """
+    The count, mean, std, min, max and `quantiles` of every column of the 2D
+    array `values`, ignoring NaNs, vectorized over the columns.
+    """
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    empty = count == 0
+    cols = np.arange(values.shape[1])
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, values, 0.0).sum(axis=0) / count
+        var = np.where(valid, (values - mean) ** 2, 0.0).sum(axis=0) / count
+
+    srt = np.sort(values, axis=0)
+    last = np.maximum(count - 1, 0)
+
+    stats = {
+        "count": count,
+        "mean": mean,
+        "std": np.sqrt(var),
+        "min": np.where(empty, np.nan, srt[0]),
+        "max": np.where(empty, np.nan, srt[last, cols]),
+    }
+    for q in quantiles:
+        pos = q * last
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        frac = pos - lo
+        value = srt[lo, cols] * (1 - frac) + srt[hi, cols] * frac
+        stats[quantile_name(q)] = np.where(empty, np.nan, value)
+    return stats
+
+
+def quantile_name(q):
+    return f"q{q * 100:g}"
+
+
+class Aggregate:
+    """
+    Statistics at every iteration of `key` of the history at `dict_path`
+    across the runs in `files`, aligned on their iterations. Complex values
+    are aggregated by their real part.
+    """
+
+    # band -> the statistics of its lower and upper edges
+    bands = ("quantiles", "std", "minmax")
+
+    def __init__(self, files, dict_path, key="Mean", quantiles=(0.25, 0.75)):
+        self.files = list(files)
+        self.dict_path = dict_path
+        self.key = key
+        self.quantiles = tuple(quantiles)
+
+        # incremented every time the statistics change, with the first
+        # column changed by every recent version
+        self.version = 0
+        self._starts = {}
+
+        n_runs = len(self.files)
+        # database version, number and last of the iterations of every run
+        # already in the aggregate
+        self._versions = [None] * n_runs
+        self._lengths = [0] * n_runs
+        self._last = [None] * n_runs
+
+        # buffers with room to grow along the iterations, only the first
+        # _size columns are valid
+        self._size = 0
+        self._iters = np.empty(0, dtype=np.int64)
+        self._values = np.empty((n_runs, 0))
+        self._stats = {}
+        # views of the statistics and bands of the current version, so that
+        # they are the same arrays until the aggregate changes
+        self._views = {}
+
+    def __repr__(self):
+        return f"Aggregate(runs={len(self.files)}, n_iters={len(self)}, {self.dict_path}/{self.key})"
+
+    @property
+    def iters(self):
+        return self._iters[: self._size]
+
+    @property
+    def values(self):
+        """The (runs, iters) array of the aligned runs."""
+        return self._values[:, : self._size]
+
+    def keys(self):
+        return list(self._stats.keys())
+
+    def __getitem__(self, k):
+        if k == "iters":
+            return self.iters
+        if k not in self._views:
+            self._views[k] = self._stats[k][: self._size]
+        return self._views[k]
+
+    def band(self, kind="quantiles"):
+        """The lower and upper edges of the band of `kind`, one of `bands`."""
+        key = ("band", kind)
+        if key not in self._views:
+            if kind == "quantiles":
+                lower = self[quantile_name(self.quantiles[0])]
+                upper = self[quantile_name(self.quantiles[-1])]
+            elif kind == "std":
+                lower = self["mean"] - self["std"]
+                upper = self["mean"] + self["std"]
+            elif kind == "minmax":
+                lower, upper = self["min"], self["max"]
+            else:
+                raise ValueError(f"Unknown band {kind}")
+            self._views[key] = (lower, upper)
+        return self._views[key]
+
+    def __len__(self):
+        return self._size
+
+    def _run(self, database, i):
+        hist = database.get_data(self.files[i], self.dict_path)
+        return np.asarray(hist.iters), np.real(hist[self.key])
+
+    def update(self, database):
+        """
+        Brings the aggregate up to date with `database`, recomputing only the
+        iterations of runs that grew. Returns True if anything changed.
+        """
+        changed = []
+        for i, file in enumerate(self.files):
+            version = database.version(file)
+            if version is None or version != self._versions[i]:
+                changed.append((i, version))
+        if not changed:
+            return False
+
+        with timed("aggregate", runs=len(changed)):
+            start = self._append(database, changed)
+            if start is None:
+                self._rebuild(database)
+                start = 0
+            for i, version in changed:
+                self._versions[i] = version
+            self._update_stats(start)
+
+        self.version += 1
+        self._starts[self.version] = start
+        self._starts.pop(self.version - 100, None)
+        self._views = {}
+        return True
+
+    def unchanged_since(self, version):
+        """The number of leading iterations whose statistics did not change since `version`."""
+        if version not in self._starts and version != self.version:
+            return 0
+        starts = [self._starts[v] for v in range(version + 1, self.version + 1)]
+        return min(starts, default=self._size)
+
+    def _rebuild(self, database):
+        runs = [self._run(database, i) for i in range(len(self.files))]
+        iters = np.unique(np.concatenate([it for it, _ in runs]))
+
+        self._size = len(iters)
+        self._iters = iters
+        self._values = np.full((len(runs), len(iters)), np.nan)
+        for i, (it, y) in enumerate(runs):
+            self._values[i, np.searchsorted(iters, it)] = y
+            self._lengths[i] = len(it)
+            self._last[i] = it[-1] if len(it) > 0 else None
+
+    def _append(self, database, changed):
+        # Returns the first column to update, or None if the runs did not
+        # just grow after the last iteration of the aggregate and it must
+        # be rebuilt.
+        if self._size == 0:
+            return None
+
+        start = self._size
+        for i, _ in changed:
+            iters, y = self._run(database, i)
+            n = self._lengths[i]
+            if len(iters) < n or (n > 0 and iters[n - 1] != self._last[i]):
+                # truncated or rewritten
+                return None
+            new_iters, new_y = iters[n:], y[n:]
+            if len(new_iters) == 0:
+                continue
+
+            # new iterations already present in other runs
+            pos = np.searchsorted(self.iters, new_iters)
+            inside = pos < self._size
+            if not np.array_equal(self.iters[pos[inside]], new_iters[inside]):
+                return None
+            if len(new_iters) > 1 and np.any(np.diff(new_iters) <= 0):
+                return None
+
+            self._grow(self._size + np.count_nonzero(~inside))
+            self._iters[self._size : self._size + len(new_iters[~inside])] = new_iters[~inside]
+            pos[~inside] = np.arange(self._size, self._size + np.count_nonzero(~inside))
+            self._size += np.count_nonzero(~inside)
+
+            self._values[i, pos] = new_y
+            self._lengths[i] = len(iters)
+            self._last[i] = iters[-1]
+            start = min(start, pos[0])
+        return start
+
+    def _grow(self, size):
+        capacity = self._values.shape[1]
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+
+        iters = np.empty(capacity, dtype=self._iters.dtype)
+        iters[: self._size] = self._iters[: self._size]
+        self._iters = iters
+
+        values = np.full((len(self.files), capacity), np.nan)
+        values[:, : self._size] = self._values[:, : self._size]
+        self._values = values
+
+        for k, v in self._stats.items():
+            stat = np.empty(capacity, dtype=v.dtype)
+            stat[: self._size] = v[: self._size]
+            self._stats[k] = stat
+
+    def _update_stats(self, start):
+        stats = column_stats(self._values[:, start : self._size], self.quantiles)
+        capacity = self._values.shape[1]
+        for k, v in stats.items():
+            if k not in self._stats or len(self._stats[k]) != capacity:
+                stat = np.empty(capacity, dtype=v.dtype)
+                if k in self._stats and start > 0:
+                    stat[:start] = self._stats[k][:start]
+                self._stats[k] = stat
+            self._stats[k][start : self._size] = v
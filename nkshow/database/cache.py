@@ -0,0 +1,175 @@
+import hashlib
+import os
+import shutil
+import time
+
+import numpy as np
+
+import orjson
+
+from .loading import LazyTree, is_converted
+from .history import History
+from .stats import StatsArray
+
+# %%
+
+
+def default_cache_dir():
+    if "NKSHOW_CACHE_DIR" in os.environ:
+        return os.environ["NKSHOW_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "nkshow")
+
+
+def _dir_size(path):
+    size = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            size += entry.stat().st_size
+    return size
+
+
+def _pack(x, directory, files):
+    if isinstance(x, LazyTree):
+        # only the converted children, items() would convert the others
+        return {"tree": {k: _pack(v, directory, files) for k, v in x._cache.items()}}
+    elif isinstance(x, dict):
+        return {"tree": {k: _pack(v, directory, files) for k, v in x.items()}}
+    elif isinstance(x, History) and x.stats is not None:
+        return {
+            "history": {
+                "iters": _pack(x.iters, directory, files),
+                "stats": _pack(x.stats.records, directory, files),
+                "keys": x.keys(),
+            }
+        }
+    elif isinstance(x, History):
+        return {
+            "history": {
+                "iters": _pack(x.iters, directory, files),
+                "values": {k: _pack(x[k], directory, files) for k in x.keys()},
+            }
+        }
+    elif isinstance(x, np.ndarray) and x.dtype != object:
+        name = f"{len(files)}.npy"
+        np.save(os.path.join(directory, name), x)
+        files.append(name)
+        return {"array": name}
+    else:
+        raise ValueError(f"Cannot cache object of type {type(x)}")
+
+
+def _load_array(directory, name):
+    path = os.path.join(directory, name)
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # empty arrays cannot be memory mapped
+        return np.load(path)
+
+
+def _unpack(spec, directory):
+    if "tree" in spec:
+        return {k: _unpack(v, directory) for k, v in spec["tree"].items()}
+    elif "history" in spec:
+        spec = spec["history"]
+        if "stats" in spec:
+            stats = StatsArray(_unpack(spec["stats"], directory))
+            return History.from_stats(stats, _unpack(spec["iters"], directory), spec["keys"])
+        values = {k: _unpack(v, directory) for k, v in spec["values"].items()}
+        return History(values, iters=_unpack(spec["iters"], directory))
+    else:
+        return _load_array(directory, spec["array"])
+
+
+class SidecarCache:
+    """
+    A persistent cache of converted logs, one directory of memory mapped
+    `.npy` files per log, kept below `max_size` bytes by LRU eviction.
+    """
+
+    def __init__(self, path=None, max_size=2 ** 30, min_age=60):
+        self.path = default_cache_dir() if path is None else path
+        self.max_size = max_size
+        # Files modified less than min_age seconds ago are probably still
+        # being written to, and are not worth caching.
+        self.min_age = min_age
+
+    def _entry_dir(self, path):
+        key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+        return os.path.join(self.path, key)
+
+    def _stamp(self, path):
+        st = os.stat(path)
+        return {"path": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime_ns}
+
+    def get(self, path):
+        """The cached tree of the log at `path`, or None if missing or out of date."""
+        entry = self._entry_dir(path)
+        index_path = os.path.join(entry, "index.json")
+        try:
+            with open(index_path, "rb") as f:
+                index = orjson.loads(f.read())
+            if index["stamp"] != self._stamp(path):
+                return None
+            data = _unpack(index["tree"], entry)
+            # mark as recently used
+            os.utime(index_path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return data
+
+    def put(self, path, data):
+        """
+        Stores the tree `data` loaded from the log at `path`, if it is fully
+        converted. Returns True if the entry was written.
+        """
+        if not is_converted(data):
+            # converting the rest here would defeat lazy loading
+            return False
+        stamp = self._stamp(path)
+        if time.time() - stamp["mtime"] / 1e9 < self.min_age:
+            return False
+
+        entry = self._entry_dir(path)
+        tmp = f"{entry}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(tmp, exist_ok=True)
+            tree = _pack(data, tmp, [])
+            with open(os.path.join(tmp, "index.json"), "wb") as f:
+                f.write(orjson.dumps({"stamp": stamp, "tree": tree}))
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.rename(tmp, entry)
+        except (OSError, ValueError):
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+
+        self.evict()
+        return True
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in max_size."""
+        entries = []
+        total = 0
+        for item in os.scandir(self.path):
+            if not item.is_dir():
+                continue
+            try:
+                last_used = os.stat(os.path.join(item.path, "index.json")).st_mtime
+            except OSError:
+                # incomplete entry, possibly still being written
+                continue
+            size = _dir_size(item.path)
+            entries.append((last_used, size, item.path))
+            total += size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,74 @@
+import numpy as np
+
+# %%
+
+
+def column_dtype(x):
+    """
+    Detects the dtype of a list of json values by looking at its first
+    non-null element. Returns None if the list is not a numeric column.
+    """
+    for xi in x:
+        if xi is None:
+            continue
+        elif isinstance(xi, bool):
+            return np.bool_
+        elif isinstance(xi, int):
+            return np.int64
+        elif isinstance(xi, float):
+            return np.float64
+        else:
+            return None
+    # empty or only nulls
+    return np.float64
+
+
+def to_column(x):
+    """
+    Converts a list of numbers to a numpy array, None gaps becoming NaN, or
+    returns None if `x` is not a numeric column.
+    """
+    dtype = column_dtype(x)
+    if dtype is None:
+        return None
+
+    if dtype is np.bool_:
+        out = np.array(x)
+        if out.dtype == np.bool_:
+            return out
+        # with gaps, filled as a float array below
+    elif dtype is np.int64:
+        # Integer columns are converted in a single pass. If they also contain
+        # floats numpy already promotes them, if they contain gaps we get an
+        # object array and fall back to filling a float array.
+        out = np.array(x)
+        if out.dtype.kind in "iuf":
+            return out
+
+    out = np.empty(len(x), dtype=np.float64)
+    try:
+        out[:] = x
+    except (TypeError, ValueError):
+        return None
+    return out
+
+
+def to_complex_column(real, imag):
+    """
+    Converts the real and imaginary lists of a column to a complex array, or
+    returns None if they are not numeric columns of the same length.
+    """
+    if not isinstance(real, list) or not isinstance(imag, list):
+        return None
+    if len(real) != len(imag):
+        return None
+    if column_dtype(real) is None or column_dtype(imag) is None:
+        return None
+
+    out = np.empty(len(real), dtype=np.complex128)
+    try:
+        out.real = real
+        out.imag = imag
+    except (TypeError, ValueError):
+        return None
+    return out
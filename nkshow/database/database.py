@@ -1,41 +1,371 @@
-from textual import log
+import asyncio
+import os
+from collections import OrderedDict
 
-from ..filewatching import FileWatcher, DirWatcher, observer
+from .. import instrumentation
+from ..instrumentation import trace, timed
+from ..workers import context, process_pool
 
-from .loading import loadfile
+from .loading import (
+    loadtree,
+    reloadfile,
+    convert_file,
+    history_lengths,
+    merge_tails,
+    tree_nbytes,
+    LoadCancelled,
+)
+from .streaming import loadstream, StreamingUnsupported
+from .hdf5 import loadh5, is_hdf5
+from .mpack import loadmpack, is_mpack
+from .cache import SidecarCache
+from .aggregate import Aggregate
+
+
+def _load_worker(path, cache, lengths, stream, progress, cancel, timings):
+    # Runs in a worker process of Database.load_file_async. Returns the data
+    # and, if `timings`, the timings of the stages to merge in the parent.
+    instrumentation.enable(timings)
+    instrumentation.reset()
+    report = progress.put if progress is not None else None
+    data = None
+    if stream:
+        try:
+            data = loadstream(path, progress=report, cancel=cancel)
+        except StreamingUnsupported:
+            pass
+    if data is None:
+        data = convert_file(path, lengths, progress=report, cancel=cancel)
+    if cache is not None and lengths is None:
+        cache.put(path, data)
+    return data, instrumentation.collect() if timings else None
+
+
+def _metadata_loader(path):
+    # The formats of which loading reads only the metadata, quick enough to
+    # be done in-process and not worth caching.
+    if is_hdf5(path):
+        return loadh5
+    elif is_mpack(path):
+        return loadmpack
+    return None
 
 
 class Database:
-    def __init__(self):
+    def __init__(
+        self,
+        incremental=True,
+        cache=True,
+        max_workers=2,
+        memory_budget=2 ** 32,
+        stream_threshold=2 ** 28,
+        watch=True,
+    ):
+        # If True, files already loaded are reloaded by only appending new iterations
+        self.incremental = incremental
+
+        # If True, loaded files are watched and reloaded when they change
+        self.watch = watch
+
+        # Files larger than this many bytes are loaded with loadstream, which
+        # never holds the whole parsed json in memory. None to disable.
+        self.stream_threshold = stream_threshold
+
+        # Persistent cache of converted logs, or None to disable it
+        if cache is True:
+            cache = SidecarCache()
+        self.cache = cache or None
+
         self._files = {}
         self._text_files = {}
+        # incremented every time the data of a file changes
+        self._versions = {}
 
         self._dirty = set()
 
-        self._watchers = {}
+        # Approximate memory budget in bytes, or None for no limit. When it
+        # is exceeded the least recently used files are evicted, unless pinned.
+        self.memory_budget = memory_budget
+        self._usage = {}
+        self._last_used = OrderedDict()
+        self._pinned = set()
+        self._evicted = set()
+
+        # Background loading
+        self.max_workers = max_workers
+        self._executor = None
+        # future of the multiprocessing manager
+        self._manager = None
+        self._loading = {}
+        self._tasks = set()
+        self._listeners = []
+        self._dirty_listeners = []
+
+        # (files, dict_path, key) -> Aggregate
+        self._aggregates = {}
+
+    def _set_file(self, path, data, appended=False):
+        # `appended` if data only adds iterations to the previous data, which
+        # the aggregates of path can follow incrementally
+        if not appended:
+            self._drop_aggregates(path)
+        self._files[path] = data
+        self._versions[path] = self._versions.get(path, 0) + 1
+        self._usage.pop(path, None)
+        self._evicted.discard(path)
+        self._touch(path)
+
+        if self.watch:
+            # imported here, as it starts the observer thread
+            from ..filewatching import watch_manager
+
+            if not watch_manager.is_watched(path):
+                watch_manager.watch_file(path, lambda _: self.notify_dirty_file(path))
+                trace("Adding file watcher for %s", path)
+
+        self._enforce_budget(keep=path)
+
+    def is_loaded(self, path):
+        return path in self._files
+
+    def version(self, path):
+        """A number that changes every time the data of `path` is reloaded."""
+        return self._versions.get(path, 0)
+
+    def _touch(self, path):
+        self._last_used[path] = None
+        self._last_used.move_to_end(path)
+
+    def memory_usage(self, path):
+        """Approximate memory in bytes used by the loaded file at `path`."""
+        if path not in self._files:
+            return 0
+        if path not in self._usage:
+            self._usage[path] = tree_nbytes(self._files[path])
+        return self._usage[path]
+
+    def total_memory_usage(self):
+        return sum(self.memory_usage(path) for path in self._files)
+
+    def set_pinned(self, paths):
+        """Sets the files that must not be evicted, such as those being plotted."""
+        self._pinned = set(paths)
+
+    def evict(self, path):
+        """Frees the data of `path`. It is reloaded on the next get_data."""
+        trace("Evicting %s (%s bytes)", path, self.memory_usage(path))
+        del self._files[path]
+        self._usage.pop(path, None)
+        self._last_used.pop(path, None)
+        self._dirty.discard(path)
+        self._evicted.add(path)
+        if self.watch:
+            from ..filewatching import watch_manager
+
+            watch_manager.unwatch_file(path)
+        self._drop_aggregates(path)
+
+    def _enforce_budget(self, keep=None):
+        if self.memory_budget is None:
+            return
+        total = self.total_memory_usage()
+        for path in list(self._last_used.keys()):
+            if total <= self.memory_budget:
+                break
+            if path == keep or path in self._pinned or path in self._loading:
+                continue
+            total -= self.memory_usage(path)
+            self.evict(path)
 
     def load_file(self, path):
-        log(f"Loading file {path} in Database (dirty={self._dirty})")
+        trace("Loading file %s in Database (dirty=%s)", path, self._dirty)
+        if path in self._files and path not in self._dirty:
+            return True
+        self._dirty.discard(path)
+
         success = True
         try:
-            data = loadfile(path)
-            self._files[path] = data
+            with timed("load", path=path):
+                loader = _metadata_loader(path)
+                if loader is not None:
+                    self._set_file(path, loader(path))
+                    return True
+
+                cached = False
+                stream = self._is_large(path)
+                appended = self.incremental and path in self._files and not stream
+                if appended:
+                    data = reloadfile(path, self._files[path])
+                else:
+                    data = self._cache_get(path)
+                    cached = data is not None
+                    if not cached:
+                        data = self._loadtree(path, stream)
+
+                if self.cache is not None and not cached:
+                    self.cache.put(path, data)
+                self._set_file(path, data, appended)
         except Exception:
             success = False
 
-        if path in self._dirty:
-            log("removing dirty path {path}")
-            self._dirty.remove(path)
+        return success
 
-        if success and path not in self._watchers:
-            handler = DirWatcher(lambda ev: self.notify_dirty_file(path))
-            self._watchers[path] = observer.schedule(handler, path, recursive=True)
-            log(f"Adding file watcher {handler}")
+    def _is_large(self, path):
+        if self.stream_threshold is None:
+            return False
+        return os.path.getsize(path) > self.stream_threshold
 
-        return success
+    def _loadtree(self, path, stream):
+        if stream:
+            try:
+                return loadstream(path)
+            except StreamingUnsupported:
+                pass
+        return loadtree(path)
+
+    def _cache_get(self, path):
+        if self.cache is None:
+            return None
+        with timed("cache", path=path):
+            return self.cache.get(path)
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = process_pool(self.max_workers)
+        return self._executor
+
+    async def _get_manager(self):
+        # the manager of the cancellation events and progress queues, whose
+        # process is started in a thread so as not to block the event loop
+        if self._manager is None:
+            self._manager = asyncio.get_running_loop().run_in_executor(None, context.Manager)
+        return await self._manager
+
+    async def load_file_async(self, path, progress=None):
+        """
+        Loads the file at `path` in a worker process, without blocking the
+        event loop. Meanwhile get_data returns the previous data of `path`.
+
+        The worker converts the whole log, as sending back the raw json of a
+        LazyTree would cost more than the arrays: logs opened this way are
+        not lazy, those loaded with load_file are. `progress` is called with
+        the fraction read. Returns False on failure or after cancel_load.
+        """
+        if path in self._files and path not in self._dirty:
+            return True
+
+        if path in self._loading:
+            _, _, done = self._loading[path]
+            await done
+            return path in self._files
+
+        if _metadata_loader(path) is not None:
+            # reading the metadata is fast enough for the event loop
+            if not self.load_file(path):
+                return False
+            for callback in self._listeners:
+                await callback(path)
+            return True
+
+        if path not in self._files:
+            data = self._cache_get(path)
+            if data is not None:
+                self._set_file(path, data)
+                return True
+
+        manager = await self._get_manager()
+        if path in self._loading:
+            # started while the manager was starting
+            return await self.load_file_async(path, progress)
+        executor = self._pool()
+        cancel = manager.Event()
+        queue = manager.Queue() if progress is not None else None
+        stream = self._is_large(path)
+        if self.incremental and path in self._files and not stream:
+            lengths = history_lengths(self._files[path])
+        else:
+            lengths = None
+
+        was_dirty = path in self._dirty
+        self._dirty.discard(path)
+
+        future = asyncio.wrap_future(
+            executor.submit(
+                _load_worker,
+                path,
+                self.cache,
+                lengths,
+                stream,
+                queue,
+                cancel,
+                instrumentation.enabled,
+            )
+        )
+        # set once the data is stored, for the other calls loading `path`
+        done = asyncio.get_running_loop().create_future()
+        self._loading[path] = (future, cancel, done)
+        try:
+            with timed("load_async", os.path.getsize(path), path=path):
+                while not future.done():
+                    await asyncio.wait([future], timeout=0.1)
+                    while queue is not None and not queue.empty():
+                        progress(queue.get_nowait())
+                data, timings = future.result()
+            if timings is not None:
+                instrumentation.merge(timings)
+            if lengths and path not in self._files:
+                # evicted while loading, the tails alone are useless
+                return False
+            if lengths:
+                data = merge_tails(self._files[path], data, lengths)
+            self._set_file(path, data, appended=bool(lengths))
+        except LoadCancelled:
+            if was_dirty:
+                self._dirty.add(path)
+            return False
+        except Exception:
+            return False
+        finally:
+            del self._loading[path]
+            done.set_result(None)
+
+        for callback in self._listeners:
+            await callback(path)
+        return True
+
+    def cancel_load(self, path):
+        """Cancels the background loading of `path`, if it is running."""
+        if path in self._loading:
+            trace("Cancelling loading of %s", path)
+            _, cancel, _ = self._loading[path]
+            cancel.set()
+
+    def is_loading(self, path):
+        return path in self._loading
+
+    def subscribe(self, callback):
+        """
+        Registers a coroutine function, called with the path of a file every
+        time it finishes loading in the background.
+        """
+        self._listeners.append(callback)
+
+    def _reload_in_background(self, path):
+        task = asyncio.ensure_future(self.load_file_async(path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def subscribe_dirty(self, callback):
+        """
+        Registers a function, called with the path of a loaded file every
+        time it changes on disk. It is called from the file watcher thread.
+        """
+        self._dirty_listeners.append(callback)
 
     def notify_dirty_file(self, path):
         self._dirty.add(path)
+        for callback in self._dirty_listeners:
+            callback(path)
 
     def load_text_file(self, path):
         with open(path, "r"):
@@ -43,22 +373,61 @@ class Database:
         return data
 
     def get_data(self, file_path, dict_path=None):
-        log(f"Database: get_data({file_path},{dict_path}) (dirty={self._dirty})")
+        trace("Database: get_data(%s,%s) (dirty=%s)", file_path, dict_path, self._dirty)
+        if file_path in self._evicted:
+            trace(" -> was evicted, reloading")
+            self.load_file(file_path)
         if file_path not in self._files:
             raise ValueError("File {file_path} not open!")
 
-        if file_path in self._dirty:
-            log(f" -> is dirty")
-            self.load_file(file_path)
+        if file_path in self._dirty and file_path not in self._loading:
+            trace(" -> is dirty")
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                self.load_file(file_path)
+            else:
+                # keep serving the stale data until the new one is loaded
+                self._reload_in_background(file_path)
 
         data = self._files[file_path]
+        self._touch(file_path)
 
         if dict_path is None:
             return data
 
-        for k in dict_path.split("/"):
-            data = data[k]
+        with timed("lookup", path=dict_path):
+            for k in dict_path.split("/"):
+                data = data[k]
+
+        trace(" -> return (%s,%s)", file_path, dict_path)
 
-        log(f" -> return ({file_path},{dict_path})")
+        # lazy nodes may have been converted
+        self._usage.pop(file_path, None)
+        self._enforce_budget(keep=file_path)
 
         return data
+
+    def get_aggregate(self, files, dict_path, key="Mean"):
+        """
+        Returns the Aggregate of `key` in the history at `dict_path` across
+        `files`, brought up to date with their latest data. Aggregates are
+        kept, so that when a file grows only its new iterations are added.
+        """
+        k = (tuple(files), dict_path, key)
+        agg = self._aggregates.get(k)
+        if agg is None:
+            agg = Aggregate(files, dict_path, key)
+            self._aggregates[k] = agg
+        agg.update(self)
+        return agg
+
+    def retain_aggregates(self, keys):
+        """Forgets the aggregates whose (files, dict_path, key) are not in `keys`."""
+        keys = set(keys)
+        for k in [k for k in self._aggregates if k not in keys]:
+            del self._aggregates[k]
+
+    def _drop_aggregates(self, path):
+        for k in [k for k in self._aggregates if path in k[0]]:
+            del self._aggregates[k]
@@ -0,0 +1,231 @@
+"""
+Reading of the HDF5 logs written by netket.logging.HDF5Log. Opening a log
+reads only its metadata, datasets are memory mapped or read when accessed.
+h5py is an optional dependency, imported only when an HDF5 log is opened.
+"""
+import numpy as np
+
+from ..instrumentation import timed
+
+from .history import History
+
+# %%
+
+H5_EXTENSIONS = (".h5", ".hdf5")
+
+
+def is_hdf5(path):
+    return path.endswith(H5_EXTENSIONS)
+
+
+def _h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("h5py is needed to read HDF5 logs (pip install h5py)") from None
+    return h5py
+
+
+def _open(path):
+    h5py = _h5py()
+    try:
+        # do not fail on logs that netket still has open for writing
+        return h5py.File(path, "r", locking=False)
+    except TypeError:
+        # h5py < 3.5
+        return h5py.File(path, "r")
+
+
+class DatasetInfo:
+    """Where a dataset is in its file, and its shape and dtype."""
+
+    __slots__ = ["path", "name", "shape", "dtype", "offset"]
+
+    def __init__(self, path, name, shape, dtype, offset=None):
+        self.path = path
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+        # byte offset of the data in the file, if it can be memory mapped
+        self.offset = offset
+
+    def __repr__(self):
+        return f"DatasetInfo({self.name}, shape={self.shape}, dtype={self.dtype})"
+
+
+def _describe(group, path):
+    h5py = _h5py()
+    desc = {}
+    for k in group.keys():
+        try:
+            v = group[k]
+        except KeyError:
+            # dangling link
+            continue
+        if isinstance(v, h5py.Group):
+            desc[k] = _describe(v, path)
+        elif isinstance(v, h5py.Dataset):
+            offset = None
+            if (
+                v.chunks is None
+                and v.compression is None
+                and v.dtype.kind in "biufc"
+                and v.size > 0
+            ):
+                offset = v.id.get_offset()
+            desc[k] = DatasetInfo(path, v.name, v.shape, v.dtype, offset)
+    return desc
+
+
+def _is_basic_index(key):
+    # Indices that h5py reads directly from the file
+    if isinstance(key, tuple):
+        return all(_is_basic_index(k) for k in key)
+    if isinstance(key, slice):
+        return key.step is None or key.step > 0
+    return key is Ellipsis or isinstance(key, (int, np.integer))
+
+
+class LazyDataset:
+    """
+    An array in an HDF5 file: slices are read from the file when indexed,
+    any other use reads and keeps the whole dataset.
+    """
+
+    def __init__(self, info):
+        self.info = info
+        self._array = None
+
+    def __repr__(self):
+        return f"LazyDataset({self.info.path}:{self.info.name}, shape={self.shape})"
+
+    @property
+    def shape(self):
+        return self.info.shape
+
+    @property
+    def dtype(self):
+        return self.info.dtype
+
+    @property
+    def ndim(self):
+        return len(self.info.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.info.shape))
+
+    @property
+    def nbytes(self):
+        """Bytes in memory, zero until the whole dataset is read."""
+        return 0 if self._array is None else self._array.nbytes
+
+    def __len__(self):
+        return self.info.shape[0]
+
+    def _read(self, key):
+        with timed("h5read", path=self.info.name):
+            with _open(self.info.path) as f:
+                return f[self.info.name][key]
+
+    def __getitem__(self, key):
+        if self._array is None and _is_basic_index(key):
+            return self._read(key)
+        return np.asarray(self)[key]
+
+    def __array__(self, dtype=None, copy=None):
+        if self._array is None:
+            self._array = np.asarray(self._read(()))
+        if dtype is None:
+            return self._array
+        return self._array.astype(dtype, copy=False)
+
+    @property
+    def real(self):
+        return np.asarray(self).real
+
+    @property
+    def imag(self):
+        return np.asarray(self).imag
+
+
+def dataset(info):
+    """The memory mapped array of the dataset described by `info`, or a LazyDataset."""
+    if info.offset is not None:
+        return np.memmap(
+            info.path, mode="r", dtype=info.dtype, offset=info.offset, shape=info.shape
+        )
+    return LazyDataset(info)
+
+
+def _is_history(desc):
+    return isinstance(desc, dict) and isinstance(desc.get("iters"), DatasetInfo)
+
+
+def _materialize(desc):
+    if isinstance(desc, DatasetInfo):
+        return dataset(desc)
+    elif _is_history(desc):
+        values = {
+            k: dataset(v)
+            for k, v in desc.items()
+            if k != "iters" and isinstance(v, DatasetInfo)
+        }
+        return History(values, iters=dataset(desc["iters"]))
+    else:
+        return H5Tree(desc)
+
+
+class H5Tree:
+    """A view over a group of an HDF5 log, creating its children on first access."""
+
+    def __init__(self, desc):
+        self._desc = desc
+        self._cache = {}
+
+    def __repr__(self):
+        return f"H5Tree(keys={self.keys()}, converted={list(self._cache.keys())})"
+
+    def keys(self):
+        return list(self._desc.keys())
+
+    def __len__(self):
+        return len(self._desc)
+
+    def __iter__(self):
+        return iter(self._desc)
+
+    def __contains__(self, k):
+        return k in self._desc
+
+    def __getitem__(self, k):
+        try:
+            return self._cache[k]
+        except KeyError:
+            pass
+        val = _materialize(self._desc[k])
+        self._cache[k] = val
+        return val
+
+    def items(self):
+        for k in self._desc:
+            yield k, self[k]
+
+    def values(self):
+        for k in self._desc:
+            yield self[k]
+
+    def is_branch(self, k):
+        """True if the child `k` is a group and not a history or a dataset."""
+        desc = self._desc[k]
+        return isinstance(desc, dict) and not _is_history(desc)
+
+
+def loadh5(path):
+    """Opens the HDF5 log at `path` as an H5Tree or History, reading only its metadata."""
+    with timed("h5meta", path=path):
+        with _open(path) as f:
+            desc = _describe(f, path)
+    if _is_history(desc):
+        return _materialize(desc)
+    return H5Tree(desc)
@@ -0,0 +1,76 @@
+import numpy as np
+
+
+class History:
+    """
+    The values of a quantity at every iteration, as numpy arrays keyed by
+    name, with the subset of the interface of netket.utils.History used by
+    nkshow. The values of netket statistics are views of `stats`.
+    """
+
+    def __init__(self, values, iters, stats=None):
+        self._values = dict(values)
+        # asanyarray keeps memory mapped iterations mapped
+        self.iters = np.asanyarray(iters)
+        self.stats = stats
+
+    @classmethod
+    def from_stats(cls, stats, iters, keys):
+        """The History of the statistics `keys` (such as "Mean") in `stats`."""
+        return cls({k: stats.column(k) for k in keys}, iters, stats=stats)
+
+    def __reduce__(self):
+        # the values of statistics would be pickled as copies of their records
+        if self.stats is not None:
+            return (History.from_stats, (self.stats, self.iters, self.keys()))
+        return (History, (self._values, self.iters))
+
+    def __repr__(self):
+        return f"History(keys={self.keys()}, n_iters={len(self)})"
+
+    def keys(self):
+        return list(self._values.keys())
+
+    def __contains__(self, k):
+        return k == "iters" or k in self._values
+
+    def __getitem__(self, k):
+        if k == "iters":
+            return self.iters
+        return self._values[k]
+
+    def __getattr__(self, k):
+        # as netket does, values are also accessible as attributes
+        try:
+            return self.__dict__["_values"][k]
+        except KeyError:
+            raise AttributeError(k)
+
+    def __len__(self):
+        return len(self.iters)
+
+    def items(self):
+        return self._values.items()
+
+    def append(self, other):
+        """A new History with the iterations of `self` followed by those of `other`."""
+        if len(other) == 0:
+            return self
+        if (
+            self.stats is not None
+            and other.stats is not None
+            and self.stats.records.dtype == other.stats.records.dtype
+        ):
+            return History.from_stats(
+                self.stats.concatenate(other.stats),
+                np.concatenate([self.iters, other.iters]),
+                self.keys(),
+            )
+        values = {k: np.concatenate([v, other[k]]) for k, v in self._values.items()}
+        return History(values, iters=np.concatenate([self.iters, other.iters]))
+
+    def to_netket(self):
+        """Converts to a netket.utils.History. Imports netket."""
+        from netket.utils import History as NetKetHistory
+
+        return NetKetHistory(dict(self._values), iters=self.iters)
@@ -0,0 +1,349 @@
+import asyncio
+import os
+import sqlite3
+import time
+import traceback
+
+import numpy as np
+
+from .. import instrumentation
+from ..instrumentation import trace, timed
+from ..workers import process_pool
+
+from .cache import default_cache_dir
+from .history import History
+from .hdf5 import H5Tree, LazyDataset, H5_EXTENSIONS, is_hdf5, loadh5
+from .loading import _parse, _is_history, _is_complex
+from .streaming import loadstream, StreamingUnsupported
+
+# %%
+
+
+def is_log(path):
+    return path.endswith((".log", ".json") + H5_EXTENSIONS)
+
+
+def escape(key):
+    """Escapes the glob special characters of `key`, to match it exactly with files_with."""
+    return "".join(f"[{c}]" if c in "*?[" else c for c in key)
+
+
+def _stamp(st):
+    return (st.st_size, st.st_mtime_ns)
+
+
+def _summary(x, prefix, res):
+    if isinstance(x, History):
+        res[prefix] = (len(x.iters), x.iters[-1] if len(x.iters) > 0 else None)
+    elif _is_history(x):
+        # raw json
+        iters = x["iters"]
+        res[prefix] = (len(iters), iters[-1] if len(iters) > 0 else None)
+    elif _is_complex(x):
+        res[prefix] = (len(x["real"]) if isinstance(x["real"], list) else None, None)
+    elif isinstance(x, (dict, H5Tree)):
+        for k, v in x.items():
+            _summary(v, f"{k}" if prefix is None else f"{prefix}/{k}", res)
+    elif isinstance(x, (list, np.ndarray, LazyDataset)):
+        res[prefix] = (len(x), None)
+    elif prefix is not None:
+        res[prefix] = (None, None)
+    return res
+
+
+def summarize(path, cache=None, stream_threshold=2 ** 28):
+    """The length and last iteration of every key path of the log at `path`, in a worker."""
+    if is_hdf5(path):
+        return _summary(loadh5(path), None, {})
+    data = cache.get(path) if cache is not None else None
+    if data is None and stream_threshold is not None:
+        if os.path.getsize(path) > stream_threshold:
+            try:
+                data = loadstream(path)
+            except StreamingUnsupported:
+                pass
+    if data is None:
+        data = _parse(path)
+    return _summary(data, None, {})
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime INTEGER,
+    error INTEGER
+);
+CREATE TABLE IF NOT EXISTS keys (
+    path TEXT,
+    key TEXT,
+    length INTEGER,
+    last_iter REAL,
+    PRIMARY KEY (path, key)
+);
+CREATE INDEX IF NOT EXISTS keys_by_key ON keys (key);
+"""
+
+
+class KeyIndex:
+    """
+    An SQLite index of the key paths of every log, valid until the size or
+    mtime of the log changes. Must only be used from the thread opening it.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.join(default_cache_dir(), "index.sqlite") if path is None else path
+        self._db = None
+
+    def _connection(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path)
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stamps(self, root=None):
+        """The (size, mtime) of every indexed log, or of those under the directory `root`."""
+        db = self._connection()
+        if root is None:
+            rows = db.execute("SELECT path, size, mtime FROM files")
+        else:
+            prefix = os.path.join(os.path.abspath(root), "")
+            rows = db.execute(
+                "SELECT path, size, mtime FROM files WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix),
+            )
+        return {path: (size, mtime) for path, size, mtime in rows}
+
+    def is_current(self, path):
+        """True if the log at `path` is indexed and did not change since."""
+        path = os.path.abspath(path)
+        row = self._connection().execute(
+            "SELECT size, mtime FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        try:
+            return row is not None and tuple(row) == _stamp(os.stat(path))
+        except OSError:
+            return False
+
+    def update(self, path, summary, stamp):
+        """Stores the `summary` of the log at `path` of (size, mtime) `stamp`, None if unreadable."""
+        path = os.path.abspath(path)
+        db = self._connection()
+        with db:
+            db.execute("DELETE FROM keys WHERE path = ?", (path,))
+            db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (path, stamp[0], stamp[1], summary is None),
+            )
+            if summary is not None:
+                db.executemany(
+                    "INSERT INTO keys VALUES (?, ?, ?, ?)",
+                    [
+                        (path, key, length, None if last is None else float(last))
+                        for key, (length, last) in summary.items()
+                    ],
+                )
+
+    def remove(self, path):
+        """Removes the log at `path` from the index, or all those under it if it is a directory."""
+        path = os.path.abspath(path)
+        prefix = os.path.join(path, "")
+        db = self._connection()
+        with db:
+            for table in ("files", "keys"):
+                db.execute(
+                    f"DELETE FROM {table} WHERE path = ? OR substr(path, 1, ?) = ?",
+                    (path, len(prefix), prefix),
+                )
+
+    def files_with(self, pattern, root=None):
+        """The logs, optionally under `root`, with a key path matching the glob `pattern`."""
+        db = self._connection()
+        with timed("index", path=pattern):
+            if root is None:
+                rows = db.execute("SELECT DISTINCT path FROM keys WHERE key GLOB ?", (pattern,))
+            else:
+                prefix = os.path.join(os.path.abspath(root), "")
+                rows = db.execute(
+                    "SELECT DISTINCT path FROM keys WHERE key GLOB ? AND substr(path, 1, ?) = ?",
+                    (pattern, len(prefix), prefix),
+                )
+            return {path for (path,) in rows}
+
+    def has_key(self, path, pattern):
+        """True if the log at `path` has a key path matching the glob `pattern`."""
+        row = self._connection().execute(
+            "SELECT 1 FROM keys WHERE path = ? AND key GLOB ? LIMIT 1",
+            (os.path.abspath(path), pattern),
+        ).fetchone()
+        return row is not None
+
+    def keys(self, path=None):
+        """The key paths of the log at `path` with their length and last iteration, or all."""
+        db = self._connection()
+        if path is None:
+            return [key for (key,) in db.execute("SELECT DISTINCT key FROM keys ORDER BY key")]
+        rows = db.execute(
+            "SELECT key, length, last_iter FROM keys WHERE path = ? ORDER BY key",
+            (os.path.abspath(path),),
+        )
+        return {key: (length, last) for key, length, last in rows}
+
+
+def _scan(root):
+    # Runs in a thread: the stamp of every log under root
+    found = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if is_log(name):
+                path = os.path.join(dirpath, name)
+                try:
+                    found[path] = _stamp(os.stat(path))
+                except OSError:
+                    pass
+    return found
+
+
+def _summarize_worker(path, cache, stream_threshold):
+    # Runs in a worker process of IndexBuilder
+    try:
+        stamp = _stamp(os.stat(path))
+    except OSError:
+        return None, None
+    try:
+        return summarize(path, cache, stream_threshold), stamp
+    except Exception:
+        return None, stamp
+
+
+class IndexBuilder:
+    """
+    Keeps a KeyIndex up to date by summarizing the queued logs in its own
+    worker processes, each at most once every `min_interval` seconds.
+    """
+
+    def __init__(self, index, cache=None, max_workers=1, min_interval=30):
+        self.index = index
+        self.cache = cache
+        self.max_workers = max_workers
+        self.min_interval = min_interval
+        self.stream_threshold = 2 ** 28
+
+        # path -> None, in the order they were queued
+        self._queue = {}
+        self._indexed_at = {}
+        self._executor = None
+        self._task = None
+        # the traceback that stopped the indexing, if it failed
+        self.failed = None
+        self._tasks = set()
+        self._listeners = []
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self.failed = None
+            self._task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @property
+    def n_queued(self):
+        return len(self._queue)
+
+    def queue(self, path):
+        self._queue[os.path.abspath(path)] = None
+
+    def remove(self, path):
+        """Drops the log or directory at `path` from the index."""
+        path = os.path.abspath(path)
+        self._queue.pop(path, None)
+        self.index.remove(path)
+        for callback in self._listeners:
+            callback(path)
+
+    async def scan(self, root):
+        """Queues the new or changed logs under `root`, and forgets the deleted ones."""
+        root = os.path.abspath(root)
+        loop = asyncio.get_running_loop()
+        with timed("scan", path=root):
+            found = await loop.run_in_executor(None, _scan, root)
+            indexed = self.index.stamps(root)
+        for path, stamp in found.items():
+            if indexed.get(path) != stamp:
+                self.queue(path)
+        for path in indexed.keys() - found.keys():
+            self.remove(path)
+        trace("Index: %s logs under %s, %s to update", len(found), root, len(self._queue))
+
+    def scan_in_background(self, root):
+        task = asyncio.ensure_future(self.scan(root))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _ready(self):
+        now = time.monotonic()
+        paths = []
+        for path in self._queue:
+            if now - self._indexed_at.get(path, -self.min_interval) >= self.min_interval:
+                paths.append(path)
+                if len(paths) == self.max_workers:
+                    break
+        return paths
+
+    async def run(self):
+        try:
+            await self._run()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # logged even without instrumentation, as the index stops growing
+            self.failed = traceback.format_exc()
+            instrumentation.error("Indexing failed:\n%s", self.failed)
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    async def _run(self):
+        if self._executor is None:
+            self._executor = process_pool(self.max_workers)
+        while True:
+            paths = self._ready()
+            if not paths:
+                await asyncio.sleep(1)
+                continue
+
+            for path in paths:
+                del self._queue[path]
+                self._indexed_at[path] = time.monotonic()
+            futures = [
+                asyncio.wrap_future(
+                    self._executor.submit(
+                        _summarize_worker, path, self.cache, self.stream_threshold
+                    )
+                )
+                for path in paths
+            ]
+            for path, future in zip(paths, futures):
+                summary, stamp = await future
+                if stamp is None:
+                    # deleted in the meantime
+                    self.index.remove(path)
+                else:
+                    self.index.update(path, summary, stamp)
+                for callback in self._listeners:
+                    callback(path)
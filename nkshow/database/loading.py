@@ -1,41 +1,32 @@
-import itertools
-from numbers import Number
+import os
+
 import numpy as np
 
 import orjson
 
-# %%
-
-
-def _all_equal(x):
-    g = itertools.groupby(x)
-    return next(g, True) and not next(g, False)
+from .columnar import to_column, to_complex_column
+from .history import History
+from .hdf5 import H5Tree, LazyDataset
+from .stats import StatsArray, is_stats_block
+from ..instrumentation import timed
 
-
-def _is_leaf(x):
-    if isinstance(x, list) and len(x) > 0:
-        if isinstance(x[0], Number):
-            # check all same type and they are numbers
-            return _all_equal(type(xi) for xi in x)
-        elif isinstance(x[0], type(None)):
-            return _all_equal(type(xi) for xi in x)
-    return False
+# %%
 
 
 def transform(x):
-    if _is_leaf(x):
-        if x[0] == None:
-            return np.full(len(x), np.nan)
-        else:
-            return np.array(x)
-    elif isinstance(x, (list, tuple)):
+    if isinstance(x, (list, tuple)):
+        col = to_column(x)
+        if col is not None:
+            return col
         return {f"{i}": transform(xi) for i, xi in enumerate(x)}
     elif isinstance(x, dict):
-        res = {k: transform(v) for k, v in x.items()}
-        if len(res) == 2 and set(x.keys()) == set(("real", "imag")):
+        if len(x) == 2 and set(x.keys()) == set(("real", "imag")):
+            col = to_complex_column(x["real"], x["imag"])
+            if col is not None:
+                return col
+            res = {k: transform(v) for k, v in x.items()}
             return res["real"] + 1j * res["imag"]
-        else:
-            return res
+        return {k: transform(v) for k, v in x.items()}
     else:
         raise ValueError(f"Unknown type: {type(x)}")
 
@@ -48,12 +39,11 @@ def _is_history(x):
     return False
 
 
-from netket.utils import History
-
-
 def collect_history(x):
     if _is_history(x):
         iters = x.pop("iters")
+        if is_stats_block(x):
+            return History.from_stats(StatsArray.from_columns(x), iters, x.keys())
         return History(x, iters=iters)
     if isinstance(x, dict):
         tree = {}
@@ -64,10 +54,364 @@ def collect_history(x):
         return x
 
 
-def loadfile(path):
+class LoadCancelled(Exception):
+    """The loading of a file was cancelled."""
+
+
+def read_file(path, progress=None, cancel=None, chunk_size=2 ** 22):
+    """Reads `path` in chunks, reporting `progress` and checking `cancel` between them."""
+    size = max(os.path.getsize(path), 1)
+    buf = bytearray()
     with open(path, "rb") as f:
-        data = orjson.loads(f.read())
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise LoadCancelled(path)
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            buf += chunk
+            if progress is not None:
+                progress(len(buf) / size)
+    return buf
+
 
-    data = transform(data)
-    data = collect_history(data)
+def _parse(path):
+    with open(path, "rb") as f:
+        raw = f.read()
+    with timed("parse", len(raw), path=path):
+        return orjson.loads(raw)
+
+
+def loadfile(path):
+    data = _parse(path)
+
+    with timed("transform", path=path):
+        data = transform(data)
+    with timed("history", path=path):
+        data = collect_history(data)
     return data
+
+
+# %% Lazy loading
+
+
+def _is_complex(x):
+    return isinstance(x, dict) and len(x) == 2 and set(x.keys()) == set(("real", "imag"))
+
+
+def _is_branch(x):
+    return isinstance(x, dict) and not _is_history(x) and not _is_complex(x)
+
+
+def materialize(x):
+    """Converts a node of the raw json tree, keeping subtrees lazy."""
+    if _is_branch(x):
+        return LazyTree(x)
+    else:
+        with timed("materialize"):
+            return collect_history(transform(x))
+
+
+class LazyTree:
+    """A view over the raw json tree of a log, converting children on first access."""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._cache = {}
+
+    def __repr__(self):
+        return f"LazyTree(keys={self.keys()}, converted={list(self._cache.keys())})"
+
+    def keys(self):
+        return list(self._raw.keys())
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __contains__(self, k):
+        return k in self._raw
+
+    def __getitem__(self, k):
+        try:
+            return self._cache[k]
+        except KeyError:
+            pass
+        val = materialize(self._raw[k])
+        self._cache[k] = val
+        # the raw json is not needed anymore and is usually much larger
+        self._raw[k] = None
+        return val
+
+    def items(self):
+        for k in self._raw:
+            yield k, self[k]
+
+    def values(self):
+        for k in self._raw:
+            yield self[k]
+
+    def is_branch(self, k):
+        """True if the child `k` is a subtree, without converting it."""
+        if k in self._cache:
+            return isinstance(self._cache[k], LazyTree)
+        return _is_branch(self._raw[k])
+
+
+def loadtree(path):
+    """Loads the log at `path`, converting its subtrees only when accessed."""
+    data = _parse(path)
+
+    if _is_branch(data):
+        return LazyTree(data)
+    else:
+        # a log whose root is a history is returned as that History
+        return collect_history(transform(data))
+
+
+# %% Memory accounting
+
+# Approximate size of a number in a json list parsed by orjson: a pointer
+# in the list plus the float object.
+_RAW_ITEM_NBYTES = 32
+
+
+def _raw_nbytes(x):
+    if isinstance(x, list):
+        if len(x) > 0 and isinstance(x[0], (dict, list)):
+            return sum(_raw_nbytes(xi) for xi in x)
+        return len(x) * _RAW_ITEM_NBYTES
+    elif isinstance(x, dict):
+        return sum(_raw_nbytes(v) for v in x.values())
+    elif x is None:
+        return 0
+    else:
+        return _RAW_ITEM_NBYTES
+
+
+def is_converted(x):
+    """True if no subtree of `x` is still raw json."""
+    if isinstance(x, LazyTree):
+        return all(k in x._cache and is_converted(x._cache[k]) for k in x._raw)
+    elif isinstance(x, dict):
+        return all(is_converted(v) for v in x.values())
+    return True
+
+
+def tree_nbytes(x):
+    """Approximate bytes of memory used by a loaded tree, not counting memory maps."""
+    if isinstance(x, np.memmap):
+        return 0
+    elif isinstance(x, np.ndarray):
+        return x.nbytes
+    elif isinstance(x, History):
+        if x.stats is not None:
+            return tree_nbytes(x.iters) + tree_nbytes(x.stats.records)
+        return tree_nbytes(x.iters) + sum(tree_nbytes(x[k]) for k in x.keys())
+    elif isinstance(x, LazyTree):
+        converted = sum(tree_nbytes(v) for v in x._cache.values())
+        return converted + _raw_nbytes(x._raw)
+    elif isinstance(x, H5Tree):
+        return sum(tree_nbytes(v) for v in x._cache.values())
+    elif isinstance(x, LazyDataset):
+        return x.nbytes
+    elif isinstance(x, dict):
+        return sum(tree_nbytes(v) for v in x.values())
+    else:
+        return 0
+
+
+# %% Incremental reloading
+
+
+class IncompatibleReload(Exception):
+    """The new content of a log cannot be appended to the previously loaded one."""
+
+
+def _tail(x, start):
+    if isinstance(x, list):
+        return x[start:]
+    elif isinstance(x, dict):
+        return {k: _tail(v, start) for k, v in x.items()}
+    else:
+        raise IncompatibleReload(f"Cannot slice {type(x)}")
+
+
+def _check_appendable(n, last, keys, x):
+    iters = x["iters"]
+    if len(iters) < n:
+        raise IncompatibleReload("History was truncated")
+    if n > 0 and iters[n - 1] != last:
+        raise IncompatibleReload("History was rewritten")
+    if set(x.keys()) != set(keys) | {"iters"}:
+        raise IncompatibleReload("History keys changed")
+
+
+def concat_history(hist, tail):
+    """A History with the iterations of `hist` followed by those of `tail`."""
+    if len(tail.iters) == 0:
+        return hist
+
+    for k in hist.keys():
+        if not isinstance(hist[k], np.ndarray) or not isinstance(tail[k], np.ndarray):
+            raise IncompatibleReload(f"Value {k} is not an array")
+
+    return hist.append(tail)
+
+
+def append_history(hist, x):
+    """Appends to `hist` the iterations of the raw history `x` that come after its last."""
+    n = len(hist.iters)
+    last = hist.iters[-1] if n > 0 else None
+    _check_appendable(n, last, hist.keys(), x)
+
+    if len(x["iters"]) == n:
+        return hist
+
+    with timed("append", iters=len(x["iters"]) - n):
+        tail = collect_history(transform(_tail(x, n)))
+        return concat_history(hist, tail)
+
+
+def _update(old, x):
+    if _is_history(x):
+        if not isinstance(old, History):
+            raise IncompatibleReload("Node became a History")
+        return append_history(old, x)
+    elif isinstance(old, LazyTree) and _is_branch(x):
+        return _update_lazy(old, x)
+    elif (
+        isinstance(x, dict)
+        and isinstance(old, dict)
+        and set(x.keys()) != set(("real", "imag"))
+    ):
+        return {
+            k: _update(old[k], v) if k in old else collect_history(transform(v))
+            for k, v in x.items()
+        }
+    else:
+        return collect_history(transform(x))
+
+
+def _update_lazy(old, x):
+    # Only the children that were already converted are carried over,
+    # the others stay lazy. If a child cannot be updated it is dropped and
+    # will be converted from scratch on access.
+    tree = LazyTree(x)
+    for k, v in list(old._cache.items()):
+        if k in x:
+            try:
+                tree._cache[k] = _update(v, x[k])
+                x[k] = None
+            except IncompatibleReload:
+                pass
+    return tree
+
+
+def reloadfile(path, data):
+    """
+    Reloads the log at `path`, previously loaded as `data`, converting only
+    the new iterations, or everything if the log was truncated or rewritten.
+    """
+    raw = _parse(path)
+
+    try:
+        return _update(data, raw)
+    except IncompatibleReload:
+        if isinstance(data, LazyTree) and _is_branch(raw):
+            return LazyTree(raw)
+        return collect_history(transform(raw))
+
+
+# %% Loading in worker processes
+
+
+class HistoryTail:
+    """The iterations of a History that come after those already loaded."""
+
+    def __init__(self, history):
+        self.history = history
+
+
+def history_lengths(x, prefix=()):
+    """The length, last iteration and keys of every History already converted in `x`."""
+    if isinstance(x, History):
+        if len(x.iters) > 0 and all(isinstance(x[k], np.ndarray) for k in x.keys()):
+            return {prefix: (len(x.iters), x.iters[-1], list(x.keys()))}
+        return {}
+    elif isinstance(x, LazyTree):
+        items = list(x._cache.items())
+    elif isinstance(x, dict):
+        items = x.items()
+    else:
+        return {}
+
+    res = {}
+    for k, v in items:
+        res.update(history_lengths(v, prefix + (k,)))
+    return res
+
+
+def _convert_tails(x, lengths, prefix, cancel=None):
+    if _is_history(x) and prefix in lengths:
+        n, last, keys = lengths[prefix]
+        try:
+            _check_appendable(n, last, keys, x)
+            return HistoryTail(collect_history(transform(_tail(x, n))))
+        except IncompatibleReload:
+            pass
+    elif _is_branch(x):
+        res = {}
+        for k, v in x.items():
+            if cancel is not None and cancel.is_set():
+                raise LoadCancelled("/".join(prefix))
+            res[k] = _convert_tails(v, lengths, prefix + (k,), cancel)
+        return res
+    return collect_history(transform(x))
+
+
+def convert_file(path, lengths=None, progress=None, cancel=None):
+    """
+    Parses and converts the whole log at `path`, in a worker process: unlike
+    the raw json of a LazyTree, the arrays are cheap to send back.
+
+    The histories listed in `lengths` (see history_lengths) are returned as
+    HistoryTail objects with only the new iterations, for merge_tails.
+    Cancellation is checked between chunks read and between subtrees, but
+    not during orjson.loads.
+    """
+    with timed("read", path=path) as t:
+        raw = read_file(path, progress=progress, cancel=cancel)
+        t.add_bytes(len(raw))
+    with timed("parse", len(raw), path=path):
+        data = orjson.loads(raw)
+    del raw
+    if cancel is not None and cancel.is_set():
+        raise LoadCancelled(path)
+
+    with timed("transform", path=path):
+        return _convert_tails(data, lengths or {}, (), cancel)
+
+
+def merge_tails(old, new, lengths):
+    """Appends the HistoryTails in `new`, from convert_file, to the histories of `old`."""
+    if isinstance(new, HistoryTail):
+        return concat_history(old, new.history)
+
+    for prefix in lengths:
+        parent = new
+        for k in prefix[:-1]:
+            parent = parent.get(k) if isinstance(parent, dict) else None
+        if not isinstance(parent, dict):
+            continue
+        node = parent.get(prefix[-1])
+        if not isinstance(node, HistoryTail):
+            continue
+
+        hist = old
+        for k in prefix:
+            hist = hist[k]
+        parent[prefix[-1]] = concat_history(hist, node.history)
+    return new
@@ -0,0 +1,261 @@
+"""
+Inspection of the .mpack snapshots written by netket with flax.serialization,
+walking the msgpack headers through a memory map without decoding arrays.
+"""
+import mmap
+import struct
+
+import numpy as np
+
+from ..instrumentation import timed
+
+# %%
+
+MPACK_EXTENSIONS = (".mpack",)
+
+# flax.serialization._MsgpackExtType
+_EXT_NDARRAY = 1
+_EXT_COMPLEX = 2
+_EXT_NPSCALAR = 3
+
+
+def is_mpack(path):
+    return path.endswith(MPACK_EXTENSIONS)
+
+
+class MpackError(ValueError):
+    """The file is not valid msgpack."""
+
+
+class _Bin:
+    # the position of a binary payload, which is not read
+    __slots__ = ["offset", "nbytes"]
+
+    def __init__(self, offset, nbytes):
+        self.offset = offset
+        self.nbytes = nbytes
+
+
+class MpackArray:
+    """An array in a msgpack file, stored in the (offset, nbytes) `segments` of it."""
+
+    def __init__(self, path, shape, dtype, segments):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.segments = segments
+
+    def __repr__(self):
+        return f"MpackArray(shape={self.shape}, dtype={self.dtype})"
+
+    @property
+    def nbytes(self):
+        return sum(n for _, n in self.segments)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def _np_dtype(self):
+        try:
+            return np.dtype(self.dtype)
+        except TypeError:
+            # such as jax's bfloat16
+            raise ValueError(f"Unsupported dtype {self.dtype}") from None
+
+    def chunks(self, chunk_size=2 ** 24):
+        """Yields the flat array in pieces of about `chunk_size` bytes."""
+        dtype = self._np_dtype()
+        chunk_size = max(chunk_size // dtype.itemsize, 1) * dtype.itemsize
+        with open(self.path, "rb") as f:
+            for offset, nbytes in self.segments:
+                f.seek(offset)
+                while nbytes > 0:
+                    buf = f.read(min(chunk_size, nbytes))
+                    if len(buf) == 0:
+                        raise MpackError("Unexpected end of file")
+                    nbytes -= len(buf)
+                    yield np.frombuffer(buf, dtype=dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        arr = np.concatenate(list(self.chunks())).reshape(self.shape)
+        return arr if dtype is None else arr.astype(dtype, copy=False)
+
+    def stats(self, chunk_size=2 ** 24):
+        """The count, NaNs, norm, mean, std, min and max (of the modulus if complex), by chunks."""
+        count = nans = 0
+        total = 0.0
+        sumsq = 0.0
+        lo, hi = np.inf, -np.inf
+        with timed("mpack_stats", self.nbytes, path=self.path):
+            for x in self.chunks(chunk_size):
+                x = x.astype(np.complex128 if x.dtype.kind == "c" else np.float64)
+                valid = x[~np.isnan(x)]
+                nans += len(x) - len(valid)
+                count += len(valid)
+                if len(valid) == 0:
+                    continue
+                total += valid.sum()
+                mod = np.abs(valid)
+                sumsq += np.dot(mod, mod)
+                lo = min(lo, mod.min() if x.dtype.kind == "c" else valid.min())
+                hi = max(hi, mod.max() if x.dtype.kind == "c" else valid.max())
+
+        mean = total / count if count > 0 else np.nan
+        var = sumsq / count - abs(mean) ** 2 if count > 0 else np.nan
+        return {
+            "count": count,
+            "nans": nans,
+            "norm": np.sqrt(sumsq),
+            "mean": mean,
+            "std": np.sqrt(max(var, 0.0)),
+            "min": lo if count > 0 else np.nan,
+            "max": hi if count > 0 else np.nan,
+        }
+
+
+class _Walker:
+    def __init__(self, buf, path):
+        self.buf = buf
+        self.pos = 0
+        self.path = path
+
+    def take(self, n):
+        if self.pos + n > len(self.buf):
+            raise MpackError("Unexpected end of file")
+        s = self.buf[self.pos : self.pos + n]
+        self.pos += n
+        return s
+
+    def uint(self, n):
+        return int.from_bytes(self.take(n), "big")
+
+    def skip(self, n):
+        if self.pos + n > len(self.buf):
+            raise MpackError("Unexpected end of file")
+        self.pos += n
+        return _Bin(self.pos - n, n)
+
+    def value(self):
+        b = self.uint(1)
+        if b <= 0x7F:
+            return b
+        elif b >= 0xE0:
+            return b - 0x100
+        elif b <= 0x8F:
+            return self.map(b & 0x0F)
+        elif b <= 0x9F:
+            return self.array(b & 0x0F)
+        elif b <= 0xBF:
+            return self.take(b & 0x1F).decode()
+        elif b == 0xC0:
+            return None
+        elif b == 0xC2:
+            return False
+        elif b == 0xC3:
+            return True
+        elif 0xC4 <= b <= 0xC6:
+            return self.skip(self.uint(1 << (b - 0xC4)))
+        elif 0xC7 <= b <= 0xC9:
+            return self.ext(self.uint(1 << (b - 0xC7)))
+        elif b == 0xCA:
+            return struct.unpack(">f", self.take(4))[0]
+        elif b == 0xCB:
+            return struct.unpack(">d", self.take(8))[0]
+        elif 0xCC <= b <= 0xCF:
+            return self.uint(1 << (b - 0xCC))
+        elif 0xD0 <= b <= 0xD3:
+            return int.from_bytes(self.take(1 << (b - 0xD0)), "big", signed=True)
+        elif 0xD4 <= b <= 0xD8:
+            return self.ext(1 << (b - 0xD4))
+        elif 0xD9 <= b <= 0xDB:
+            return self.take(self.uint(1 << (b - 0xD9))).decode()
+        elif b == 0xDC:
+            return self.array(self.uint(2))
+        elif b == 0xDD:
+            return self.array(self.uint(4))
+        elif b == 0xDE:
+            return self.map(self.uint(2))
+        elif b == 0xDF:
+            return self.map(self.uint(4))
+        raise MpackError(f"Invalid msgpack byte {b:#x} at {self.pos - 1}")
+
+    def array(self, n):
+        return [self.value() for _ in range(n)]
+
+    def map(self, n):
+        res = {}
+        for _ in range(n):
+            k = self.value()
+            res[f"{k}"] = self.value()
+        if "__msgpack_chunked_array__" in res:
+            return self.chunked_array(res)
+        return res
+
+    def ext(self, n):
+        code = int.from_bytes(self.take(1), "big", signed=True)
+        end = self.pos + n
+        if code in (_EXT_NDARRAY, _EXT_NPSCALAR):
+            shape, dtype, data = self.value()
+            arr = MpackArray(self.path, shape, dtype, [(data.offset, data.nbytes)])
+            if code == _EXT_NPSCALAR:
+                # a single number, cheap to read
+                arr = np.asarray(arr)[()]
+        elif code == _EXT_COMPLEX:
+            real, imag = self.value()
+            arr = complex(real, imag)
+        else:
+            arr = self.skip(n)
+            arr = MpackArray(self.path, (n,), "uint8", [(arr.offset, arr.nbytes)])
+        self.pos = end
+        return arr
+
+    def chunked_array(self, spec):
+        # flax splits arrays larger than its maximum chunk size, storing the
+        # chunks and the shape as dictionaries keyed by the index
+        chunks = [spec["chunks"][k] for k in sorted(spec["chunks"], key=int)]
+        shape = spec["shape"]
+        if isinstance(shape, dict):
+            shape = [shape[k] for k in sorted(shape, key=int)]
+        segments = [s for c in chunks for s in c.segments]
+        dtype = chunks[0].dtype if chunks else "float64"
+        return MpackArray(self.path, tuple(int(d) for d in shape), dtype, segments)
+
+
+def _bins_to_arrays(x, path):
+    # binary payloads outside of arrays become arrays of bytes
+    if isinstance(x, _Bin):
+        return MpackArray(path, (x.nbytes,), "uint8", [(x.offset, x.nbytes)])
+    elif isinstance(x, dict):
+        return {k: _bins_to_arrays(v, path) for k, v in x.items()}
+    elif isinstance(x, list):
+        return {f"{i}": _bins_to_arrays(v, path) for i, v in enumerate(x)}
+    return x
+
+
+def loadmpack(path):
+    """The tree of the msgpack file at `path`, with MpackArray leaves and lists as dictionaries."""
+    with timed("mpack", path=path):
+        with open(path, "rb") as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file
+                raise MpackError("Empty file") from None
+        with buf:
+            w = _Walker(buf, path)
+            data = w.value()
+        return _bins_to_arrays(data, path)
+
+
+def payload_nbytes(x):
+    """The total bytes of the arrays in the tree `x`."""
+    if isinstance(x, MpackArray):
+        return x.nbytes
+    elif isinstance(x, dict):
+        return sum(payload_nbytes(v) for v in x.values())
+    return 0
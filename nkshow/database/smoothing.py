@@ -0,0 +1,223 @@
+import numpy as np
+
+from ..instrumentation import timed
+
+from .streaming import ColumnBuffer
+
+# %%
+
+
+def _ffill(x, last):
+    # Replaces the NaNs of x with the previous value, or with `last` at the start
+    valid = ~np.isnan(x)
+    if valid.all():
+        return x
+    idx = np.where(valid, np.arange(len(x)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    return np.where(idx >= 0, x[np.maximum(idx, 0)], last)
+
+
+def ema_block(x, alpha, start):
+    """
+    The exponential moving average of `x` continuing from `start`, as a
+    cumulative sum scaled by powers of (1 - alpha), in blocks bounding them.
+    """
+    b = 1.0 - alpha
+    if b <= 0.0:
+        return x.copy()
+    size = max(1, int(50.0 / -np.log(b)))
+    y = np.empty(len(x))
+    for i in range(0, len(x), size):
+        block = x[i : i + size]
+        inv = b ** -np.arange(len(block), dtype=np.float64)
+        y[i : i + size] = (b * start + alpha * np.cumsum(block * inv)) / inv
+        start = y[i + len(block) - 1]
+    return y
+
+
+class Rolling:
+    """
+    The rolling mean and variance over `window` values of a growing series,
+    and its EMA of the same span, updated in O(new values). NaNs are ignored.
+    """
+
+    def __init__(self, window):
+        self.window = int(window)
+        self.alpha = 2.0 / (self.window + 1)
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self._shift = None
+        self._x = ColumnBuffer()
+        # cumulative sums of the values, their squares and their count, with
+        # a leading 0 so that the sum of the values in [i, j) is c[j] - c[i].
+        # The values are shifted by the first one, to avoid cancellations.
+        self._csum = ColumnBuffer()
+        self._csq = ColumnBuffer()
+        self._ccount = ColumnBuffer()
+        for c in (self._csum, self._csq, self._ccount):
+            c.append(np.zeros(1))
+        self._mean = ColumnBuffer()
+        self._var = ColumnBuffer()
+        self._ema = ColumnBuffer()
+        # the arrays returned until the next change, so that they are the
+        # same objects across redraws
+        self._views = {}
+
+    def __len__(self):
+        return self.n
+
+    def _view(self, name, compute):
+        if name not in self._views:
+            self._views[name] = compute()
+        return self._views[name]
+
+    @property
+    def mean(self):
+        return self._view("mean", lambda: self._mean.values)
+
+    @property
+    def var(self):
+        return self._view("var", lambda: self._var.values)
+
+    @property
+    def std(self):
+        return self._view("std", lambda: np.sqrt(self._var.values))
+
+    @property
+    def ema(self):
+        return self._view("ema", lambda: self._ema.values)
+
+    @property
+    def band(self):
+        """The lower and upper edges of one standard deviation around the mean."""
+        return self._view("band", lambda: (self.mean - self.std, self.mean + self.std))
+
+    def truncate(self, n):
+        """Forgets the values after the first `n`."""
+        if n >= self.n:
+            return
+        if n <= 0:
+            self.reset()
+            return
+        for c in (self._csum, self._csq, self._ccount):
+            c.truncate(n + 1)
+        for c in (self._x, self._mean, self._var, self._ema):
+            c.truncate(n)
+        self.n = n
+        self._views = {}
+
+    def update(self, y):
+        """Brings the statistics up to date with the series `y`, returning self."""
+        n = self.n
+        if len(y) < n or (n > 0 and not _same(np.real(y[n - 1]), self._x.values[n - 1])):
+            # truncated or rewritten
+            self.reset()
+            n = 0
+        if len(y) > n:
+            with timed("rolling", points=len(y) - n):
+                self._append(np.real(np.asarray(y[n:])).astype(np.float64))
+        return self
+
+    def _append(self, x):
+        n0, n1 = self.n, self.n + len(x)
+        valid = ~np.isnan(x)
+        if self._shift is None and valid.any():
+            self._shift = x[valid][0]
+        shifted = np.where(valid, x - (self._shift or 0.0), 0.0)
+
+        self._x.append(x)
+        self._csum.append(self._csum.values[-1] + np.cumsum(shifted))
+        self._csq.append(self._csq.values[-1] + np.cumsum(shifted * shifted))
+        self._ccount.append(self._ccount.values[-1] + np.cumsum(valid))
+
+        hi = np.arange(n0 + 1, n1 + 1)
+        lo = np.maximum(hi - self.window, 0)
+        csum, csq, ccount = self._csum.values, self._csq.values, self._ccount.values
+        count = ccount[hi] - ccount[lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (csum[hi] - csum[lo]) / count
+            var = (csq[hi] - csq[lo]) / count - mean * mean
+        self._mean.append(mean + (self._shift or 0.0))
+        self._var.append(np.maximum(var, 0.0))
+
+        # the average is updated at the valid values, and held at the NaNs
+        last = self._ema.values[-1] if n0 > 0 else np.nan
+        ema = np.full(len(x), np.nan)
+        if valid.any():
+            start = x[valid][0] if np.isnan(last) else last
+            ema[valid] = ema_block(x[valid], self.alpha, start)
+        self._ema.append(_ffill(ema, last))
+
+        self.n = n1
+        self._views = {}
+
+
+def _same(a, b):
+    return a == b or (a != a and b != b)
+
+
+class Smoothing:
+    """
+    The smoothing of the plotted series, `mode` being None, "mean" or "ema"
+    over `window` iterations, keeping a Rolling for every series.
+    """
+
+    modes = (None, "mean", "ema")
+
+    def __init__(self, window=50):
+        self.window = window
+        self.mode = None
+        # key of the series -> Rolling
+        self._series = {}
+        # key of the series -> version of its source
+        self._versions = {}
+
+    def __repr__(self):
+        return f"Smoothing({self.mode}, window={self.window})"
+
+    def cycle_mode(self):
+        self.mode = self.modes[(self.modes.index(self.mode) + 1) % len(self.modes)]
+
+    def set_window(self, window):
+        self.window = max(2, int(window))
+
+    def label(self):
+        """A suffix for the labels of the smoothed series."""
+        return "" if self.mode is None else f" ({self.mode} {self.window})"
+
+    def rolling(self, key, y, source=None):
+        """
+        The Rolling of the series `key`, up to date with its values `y`. If
+        they can change before their end, `source` has a version and
+        unchanged_since(version), as an Aggregate.
+        """
+        r = self._series.get(key)
+        if r is None or r.window != self.window:
+            r = Rolling(self.window)
+            self._series[key] = r
+            self._versions.pop(key, None)
+        if source is not None:
+            if key in self._versions:
+                r.truncate(source.unchanged_since(self._versions[key]))
+            else:
+                r.reset()
+            self._versions[key] = source.version
+        return r.update(y)
+
+    def apply(self, key, y, source=None):
+        """The smoothed `y`, and the edges of its rolling std band in "mean" mode or None."""
+        if self.mode is None:
+            return y, None
+        r = self.rolling(key, y, source)
+        if self.mode == "ema":
+            return r.ema, None
+        return r.mean, r.band
+
+    def retain(self, keys):
+        """Forgets the series not in `keys`."""
+        keys = set(keys)
+        for key in [k for k in self._series if k not in keys]:
+            del self._series[key]
+            self._versions.pop(key, None)
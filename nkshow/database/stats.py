@@ -13,35 +13,118 @@ class Stats:
         return f"{self.mean} ± {self.err} [σ²={self.variance}, τ={self.tau}, R̂={self.r_hat}"
 
 
+# Keys of the statistics logged by netket -> fields of the records
+STATS_FIELDS = {
+    "Mean": "mean",
+    "Sigma": "error",
+    "Variance": "variance",
+    "TauCorr": "tau",
+    "R_hat": "r_hat",
+}
+
+
 class StatsArray:
-    def __init__(self, mean, err, variance, tau, r_hat):
-        self.mean = mean
-        self.err = err
-        self.variance = variance
-        self.tau = tau
-        self.r_hat = r_hat
+    """
+    The Monte Carlo statistics of a quantity at every iteration, as one
+    structured array with a field per statistic logged, viewed by columns.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self._bands = {}
+
+    def __reduce__(self):
+        # without the cached bands
+        return (StatsArray, (self.records,))
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Builds a StatsArray from netket statistics keys to arrays, with fields for those present only."""
+        mean = columns["Mean"]
+        dtype = [
+            (field, "c16" if field == "mean" and np.iscomplexobj(mean) else "f8")
+            for key, field in STATS_FIELDS.items()
+            if key in columns
+        ]
+        records = np.empty(len(mean), dtype=dtype)
+        for key, field in STATS_FIELDS.items():
+            if key in columns:
+                records[field] = columns[key]
+        return cls(records)
+
+    def field(self, name):
+        """The view of the field `name` of the records, or None if it was not logged."""
+        if name not in self.records.dtype.names:
+            return None
+        return self.records[name]
+
+    @property
+    def mean(self):
+        return self.records["mean"]
+
+    @property
+    def err(self):
+        return self.field("error")
+
+    @property
+    def variance(self):
+        return self.field("variance")
+
+    @property
+    def tau(self):
+        return self.field("tau")
+
+    @property
+    def r_hat(self):
+        return self.field("r_hat")
+
+    def column(self, key):
+        """The view of the column of a netket statistics key, such as "Sigma"."""
+        return self.records[STATS_FIELDS[key]]
+
+    def band(self, nsigma=1):
+        """The lower and upper edges of the error band of the real part of the mean, or None without errors."""
+        if self.err is None:
+            return None
+        if nsigma not in self._bands:
+            mean = self.records["mean"].real
+            err = nsigma * self.records["error"]
+            self._bands[nsigma] = (mean - err, mean + err)
+        return self._bands[nsigma]
+
+    def concatenate(self, other):
+        return StatsArray(np.concatenate([self.records, other.records]))
+
+    def __len__(self):
+        return len(self.records)
 
     def __getitem__(self, i):
-        if isinstance(i, int):
-            return Stats(
-                self.mean[i], self.err[i], self.variance[i], self.tau[i], self.r_hat[i]
-            )
+        if isinstance(i, (int, np.integer)):
+            r = self.records[i]
+            names = r.dtype.names
+            return Stats(*(r[f] if f in names else np.nan for f in STATS_FIELDS.values()))
         else:
-            return StatsArray(
-                self.mean[i], self.err[i], self.variance[i], self.tau[i], self.r_hat[i]
-            )
+            return StatsArray(self.records[i])
 
     def __repr__(self):
-        return f"StatsArray(n={len(self.mean)})"
+        return f"StatsArray(n={len(self.records)})"
 
     def keys(self):
         return ["mean", "err", "variance", "tau", "r_hat"]
 
 
-dtype_re = [
-    ("mean", "f8"),
-    ("error", "f8"),
-    ("variance", "f8"),
-    ("tau", "f8"),
-    ("r_hat", "f8"),
-]
+def is_stats_block(values):
+    """True if the `values` of a history are netket statistics arrays of the same length."""
+    if "Mean" not in values or not set(values.keys()) <= set(STATS_FIELDS):
+        return False
+    n = None
+    for k, v in values.items():
+        if not isinstance(v, np.ndarray) or v.ndim != 1 or v.dtype.kind not in "iufc":
+            return False
+        if k != "Mean" and v.dtype.kind == "c":
+            return False
+        if n is not None and len(v) != n:
+            return False
+        n = len(v)
+    return True
+
@@ -0,0 +1,233 @@
+"""
+Streaming ingestion of logs too large to be parsed in one go: the values
+of every list are appended to a typed buffer one chunk of the file at a
+time. Only the layout of netket's JsonLog is supported, anything else
+raises StreamingUnsupported.
+"""
+import os
+import re
+
+import numpy as np
+
+import orjson
+
+from .columnar import to_column
+from .loading import collect_history, LoadCancelled
+from ..instrumentation import timed
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+
+
+class StreamingUnsupported(Exception):
+    """The file does not have a layout that can be streamed."""
+
+
+class ColumnBuffer:
+    """A numpy array grown by appending chunks, promoting its dtype if needed."""
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._data = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def values(self):
+        """A view of the values appended so far."""
+        if self._data is None:
+            return np.empty(0, dtype=np.float64)
+        return self._data[: self._size]
+
+    def append(self, values):
+        n = len(values)
+        if n == 0:
+            # an empty chunk says nothing about the dtype
+            return
+
+        if self._data is None:
+            self._data = np.empty(max(n, self.capacity), dtype=values.dtype)
+        else:
+            dtype = np.result_type(self._data, values)
+            size = self._size + n
+            if dtype != self._data.dtype or size > len(self._data):
+                data = np.empty(max(size, 2 * len(self._data)), dtype=dtype)
+                data[: self._size] = self._data[: self._size]
+                self._data = data
+
+        self._data[self._size : self._size + n] = values
+        self._size += n
+
+    def truncate(self, size):
+        """Drops the values after the first `size`."""
+        self._size = min(self._size, size)
+
+    def finish(self):
+        """Returns the values appended so far, releasing the spare capacity."""
+        if self._data is None:
+            return np.empty(0, dtype=np.float64)
+        data, self._data = self._data, None
+        data.resize(self._size, refcheck=False)
+        return data
+
+
+class _Reader:
+    def __init__(self, f, chunk_size, progress=None, cancel=None):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.cancel = cancel
+        self.size = os.fstat(f.fileno()).st_size
+        self.nread = 0
+        self.buf = b""
+        self.pos = 0
+
+    def fill(self):
+        """Reads the next chunk. Returns False at the end of the file."""
+        if self.cancel is not None and self.cancel.is_set():
+            raise LoadCancelled(self.f.name)
+
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+
+        self.nread += len(chunk)
+        if self.progress is not None and self.size > 0:
+            self.progress(self.nread / self.size)
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace byte, without consuming it."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos : self.pos + 1]
+            if not self.fill():
+                raise ValueError("Unexpected end of file")
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise ValueError(f"Expected {c!r} at byte {self.nread - len(self.buf) + self.pos}")
+        self.pos += 1
+
+    def string(self):
+        if self.peek() != b'"':
+            raise StreamingUnsupported("Expected an object key")
+
+        end = self.pos
+        while True:
+            end = self.buf.find(b'"', end + 1)
+            if end < 0:
+                end = len(self.buf) - 1 - self.pos
+                if not self.fill():
+                    raise ValueError("Unexpected end of file")
+                continue
+            # skip escaped quotes
+            i = end
+            while self.buf[i - 1] == ord("\\"):
+                i -= 1
+            if (end - i) % 2 == 0:
+                break
+
+        s = orjson.loads(self.buf[self.pos : end + 1])
+        self.pos = end + 1
+        return s
+
+
+def _parse_values(segment):
+    try:
+        col = to_column(orjson.loads(b"[" + segment + b"]"))
+    except orjson.JSONDecodeError:
+        col = None
+    if col is None:
+        raise StreamingUnsupported("List is not a numeric column")
+    return col
+
+
+def _parse_column(r):
+    r.expect(b"[")
+    if r.peek() in (b"[", b"{"):
+        raise StreamingUnsupported("Nested lists are not supported")
+
+    column = ColumnBuffer()
+    while True:
+        end = r.buf.find(b"]", r.pos)
+        if end >= 0:
+            column.append(_parse_values(r.buf[r.pos : end]))
+            r.pos = end + 1
+            return column.finish()
+
+        # convert all the complete values in the buffer
+        last = r.buf.rfind(b",", r.pos)
+        if last >= 0:
+            column.append(_parse_values(r.buf[r.pos : last]))
+            r.pos = last + 1
+
+        if not r.fill():
+            raise ValueError("Unexpected end of file")
+
+
+def _finish_object(obj):
+    if len(obj) == 2 and set(obj.keys()) == set(("real", "imag")):
+        real, imag = obj["real"], obj["imag"]
+        if isinstance(real, np.ndarray) and isinstance(imag, np.ndarray):
+            if len(real) != len(imag):
+                raise StreamingUnsupported("Real and imaginary parts differ in length")
+            out = np.empty(len(real), dtype=np.complex128)
+            out.real = real
+            out.imag = imag
+            return out
+    return obj
+
+
+def _parse_object(r):
+    r.expect(b"{")
+    obj = {}
+    if r.peek() == b"}":
+        r.pos += 1
+        return obj
+
+    while True:
+        key = r.string()
+        r.expect(b":")
+        obj[key] = _parse_value(r)
+
+        c = r.peek()
+        r.pos += 1
+        if c == b"}":
+            return _finish_object(obj)
+        elif c != b",":
+            raise ValueError(f"Expected ',' or '}}', got {c!r}")
+
+
+def _parse_value(r):
+    c = r.peek()
+    if c == b"{":
+        return _parse_object(r)
+    elif c == b"[":
+        return _parse_column(r)
+    else:
+        raise StreamingUnsupported(f"Unsupported value starting with {c!r}")
+
+
+def loadstream(path, chunk_size=2 ** 22, progress=None, cancel=None):
+    """
+    Loads and converts the log at `path` reading it in chunks. Raises
+    StreamingUnsupported if it is not a netket JsonLog, or is truncated.
+    """
+    with timed("stream", os.path.getsize(path), path=path):
+        with open(path, "rb") as f:
+            r = _Reader(f, chunk_size, progress=progress, cancel=cancel)
+            try:
+                if r.peek() != b"{":
+                    raise StreamingUnsupported("The log is not a json object")
+                data = _parse_object(r)
+            except ValueError as e:
+                # truncated, possibly still being written, or invalid: the
+                # regular loaders report it
+                raise StreamingUnsupported(str(e)) from e
+
+        return collect_history(data)
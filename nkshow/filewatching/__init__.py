@@ -1,7 +1,10 @@
 from .dir_watcher import DirWatcher
 from .file_watch import FileWatcher
+from .watch_manager import WatchManager
 
 from watchdog.observers import Observer as _Observer
 
 observer = _Observer()
 observer.start()
+
+watch_manager = WatchManager(observer)
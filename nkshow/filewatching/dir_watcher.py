@@ -1,7 +1,5 @@
 from watchdog.events import FileSystemEventHandler
 
-from textual import log
-
 
 class DirWatcher(FileSystemEventHandler):
     """Logs all the events captured."""
@@ -26,6 +24,6 @@ class DirWatcher(FileSystemEventHandler):
         self.callback(event)
 
     def on_modified(self, event):
-        super().on_deleted(event)
+        super().on_modified(event)
         # log(f"processing event deeleted {event}")
         self.callback(event)
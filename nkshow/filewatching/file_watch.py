@@ -1,7 +1,5 @@
 from watchdog.events import FileSystemEventHandler
 
-from textual import log
-
 
 class FileWatcher(FileSystemEventHandler):
     """Logs all the events captured."""
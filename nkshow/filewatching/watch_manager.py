@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+
+from .dir_watcher import DirWatcher
+
+
+class WatchManager:
+    """
+    Watches files through one non-recursive watch per parent directory,
+    calling the callback of a file at most once every `interval` seconds.
+    """
+
+    def __init__(self, observer, interval=1.0):
+        self.observer = observer
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        # directory -> (watch, set of watched files in it)
+        self._dirs = {}
+        # file -> callback
+        self._callbacks = {}
+        # file -> time of last notification
+        self._last = {}
+        # file -> timer of the delayed notification
+        self._pending = {}
+
+    def watch_file(self, path, callback):
+        """Calls `callback(path)` when the file at `path` changes."""
+        path = os.path.abspath(path)
+        directory = os.path.dirname(path)
+        with self._lock:
+            self._callbacks[path] = callback
+            if directory in self._dirs:
+                self._dirs[directory][1].add(path)
+            else:
+                handler = DirWatcher(self._on_event)
+                watch = self.observer.schedule(handler, directory, recursive=False)
+                self._dirs[directory] = (watch, {path})
+
+    def unwatch_file(self, path):
+        path = os.path.abspath(path)
+        directory = os.path.dirname(path)
+        with self._lock:
+            self._callbacks.pop(path, None)
+            self._last.pop(path, None)
+            timer = self._pending.pop(path, None)
+            if timer is not None:
+                timer.cancel()
+
+            if directory in self._dirs:
+                watch, files = self._dirs[directory]
+                files.discard(path)
+                if len(files) == 0:
+                    self.observer.unschedule(watch)
+                    del self._dirs[directory]
+
+    def is_watched(self, path):
+        return os.path.abspath(path) in self._callbacks
+
+    def _on_event(self, event):
+        # Runs in the observer thread
+        if event.is_directory:
+            return
+        self._notify(os.path.abspath(event.src_path))
+        dest_path = getattr(event, "dest_path", None)
+        if dest_path:
+            self._notify(os.path.abspath(dest_path))
+
+    def _notify(self, path):
+        with self._lock:
+            if path not in self._callbacks or path in self._pending:
+                return
+            delay = self._last.get(path, float("-inf")) + self.interval - time.monotonic()
+            if delay > 0:
+                timer = threading.Timer(delay, self._fire, (path,))
+                timer.daemon = True
+                self._pending[path] = timer
+                timer.start()
+                return
+        self._fire(path)
+
+    def _fire(self, path):
+        with self._lock:
+            self._pending.pop(path, None)
+            callback = self._callbacks.get(path)
+            self._last[path] = time.monotonic()
+        if callback is not None:
+            callback(path)
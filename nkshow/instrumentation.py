@@ -0,0 +1,153 @@
+"""
+Timing of the stages of loading and rendering logs, shown by the stats
+panel. When disabled, `timed` and `trace` cost no more than a call.
+"""
+import os
+import time
+from collections import deque
+
+import orjson
+
+enabled = False
+
+# If True, trace writes to the textual log even when timings are disabled.
+# Opted into by setting NKSHOW_DEBUG, as formatting the messages of the hot
+# paths is not free.
+debug = bool(os.environ.get("NKSHOW_DEBUG"))
+
+# stage -> StageStats
+stats = {}
+
+# most recent structured records
+records = deque(maxlen=1000)
+
+
+class StageStats:
+    __slots__ = ["count", "total", "last", "max", "nbytes"]
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+        self.nbytes = 0
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def add(self, duration, nbytes):
+        self.count += 1
+        self.total += duration
+        self.last = duration
+        self.max = max(self.max, duration)
+        self.nbytes += nbytes
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.last = other.last
+        self.max = max(self.max, other.max)
+        self.nbytes += other.nbytes
+
+
+def enable(value=True):
+    global enabled
+    enabled = value
+
+
+def reset():
+    stats.clear()
+    records.clear()
+
+
+def _log(text):
+    # textual is only imported when there is something to log
+    from textual import log
+
+    try:
+        log(text)
+    except LookupError:
+        # no running app
+        pass
+
+
+def trace(msg, *args):
+    """Logs `msg % args` to the textual log, formatting it only if enabled or debugging."""
+    if enabled or debug:
+        _log(msg % args if args else msg)
+
+
+def error(msg, *args):
+    """Logs `msg % args` to the textual log, always."""
+    _log(msg % args if args else msg)
+
+
+def record(stage, duration, nbytes=0, **info):
+    if stage not in stats:
+        stats[stage] = StageStats()
+    stats[stage].add(duration, nbytes)
+
+    entry = {"stage": stage, "duration": duration, "bytes": nbytes, **info}
+    records.append(entry)
+    _log(orjson.dumps(entry, default=str).decode())
+
+
+def collect():
+    """The statistics and records of the timings since the last reset, to be merged."""
+    return dict(stats), list(records)
+
+
+def merge(collected):
+    """Adds the timings returned by collect in another process, such as a worker."""
+    worker_stats, worker_records = collected
+    for stage, s in worker_stats.items():
+        if stage not in stats:
+            stats[stage] = StageStats()
+        stats[stage].merge(s)
+    for entry in worker_records:
+        records.append(entry)
+        _log(orjson.dumps(entry, default=str).decode())
+
+
+class _Timer:
+    __slots__ = ["stage", "nbytes", "info", "t0"]
+
+    def __init__(self, stage, nbytes, info):
+        self.stage = stage
+        self.nbytes = nbytes
+        self.info = info
+
+    def add_bytes(self, nbytes):
+        self.nbytes += nbytes
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, time.perf_counter() - self.t0, self.nbytes, **self.info)
+        return False
+
+
+class _NullTimer:
+    __slots__ = []
+
+    def add_bytes(self, nbytes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+def timed(stage, nbytes=0, **info):
+    """Records the duration of the block as `stage`, with the bytes processed and `info`."""
+    if not enabled:
+        return _null_timer
+    return _Timer(stage, nbytes, info)
@@ -0,0 +1,216 @@
+"""
+Prints the data at a dict path of many logs, without the interface.
+
+    nkshow query "runs/**/*.log" Energy --format csv > energy.csv
+    nkshow query runs/*.log Energy/Mean --format json -o energy.jsonl
+    nkshow query runs/*.log Energy --format npy -o energy/
+
+csv: one row per iteration, with the log as first column. Complex columns
+     are split into .real and .imag columns.
+json: one line per log, with complex columns stored as real/imag objects.
+npy: one structured array per log in the output directory, at the path
+     of the log with .npy appended.
+"""
+# This module must not import textual, directly or not
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+import orjson
+
+from .database.database import Database
+
+# The database of the current worker process
+_database = None
+
+
+def _init_worker(cache):
+    global _database
+    _database = Database(cache=cache, memory_budget=None, watch=False)
+
+
+def expand_paths(patterns):
+    """
+    Expands the glob patterns in `patterns`, keeping the order and dropping
+    duplicates. Paths without patterns are kept even if missing, to be reported.
+    """
+    paths = {}
+    for pattern in patterns:
+        if any(c in pattern for c in "*?["):
+            matches = [p for p in sorted(glob.glob(pattern, recursive=True)) if os.path.isfile(p)]
+        else:
+            matches = [pattern]
+        for path in matches:
+            paths[path] = None
+    return list(paths)
+
+
+def columns(data):
+    """The named columns of a History (including the iterations) or of an array."""
+    if hasattr(data, "iters") and hasattr(data, "keys"):
+        cols = {"iters": data.iters}
+        cols.update((k, data[k]) for k in data.keys())
+        return cols
+    elif isinstance(data, np.ndarray):
+        return {"value": data}
+    else:
+        raise ValueError("Not a history or an array")
+
+
+def query_file(task):
+    # Runs in a worker process. Returns the columns at `dict_path` of the
+    # log at `path`, or the error that prevented reading them.
+    path, dict_path = task
+    try:
+        if not _database.load_file(path):
+            raise ValueError("Could not load the log")
+        cols = columns(_database.get_data(path, dict_path))
+        # copy out of the memory mapped cache before the file is released
+        return path, {k: np.array(v) for k, v in cols.items()}, None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+    finally:
+        if _database.is_loaded(path):
+            _database.evict(path)
+
+
+def _real_columns(cols):
+    names, arrays = [], []
+    for k, v in cols.items():
+        if np.iscomplexobj(v):
+            names += [f"{k}.real", f"{k}.imag"]
+            arrays += [v.real, v.imag]
+        else:
+            names.append(k)
+            arrays.append(v)
+    return names, arrays
+
+
+def _csv_quote(s):
+    return '"' + s.replace('"', '""') + '"'
+
+
+class CsvWriter:
+    def __init__(self, out):
+        self.out = out
+        self.header = None
+
+    def write(self, path, cols):
+        names, arrays = _real_columns(cols)
+        header = ["file"] + names
+        if self.header is None:
+            self.header = header
+            self.out.write((",".join(header) + "\n").encode())
+        elif header != self.header:
+            raise ValueError(f"Columns {names} differ from those of the previous logs")
+
+        fmt = [_csv_quote(path).replace("%", "%%")]
+        fmt += ["%d" if a.dtype.kind in "biu" else "%s" for a in arrays]
+        np.savetxt(self.out, np.column_stack(arrays), fmt=",".join(fmt))
+
+
+class JsonWriter:
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, path, cols):
+        record = {"file": path}
+        for k, v in cols.items():
+            if np.iscomplexobj(v):
+                record[k] = {
+                    "real": np.ascontiguousarray(v.real),
+                    "imag": np.ascontiguousarray(v.imag),
+                }
+            else:
+                record[k] = np.ascontiguousarray(v)
+        self.out.write(orjson.dumps(record, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n")
+
+
+class NpyWriter:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, path, cols):
+        out = self.output_path(path)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+
+        n = len(next(iter(cols.values())))
+        records = np.empty(n, dtype=[(k, v.dtype) for k, v in cols.items()])
+        for k, v in cols.items():
+            records[k] = v
+        np.save(out, records)
+
+    def output_path(self, path):
+        rel = os.path.relpath(path)
+        if rel.startswith(os.pardir):
+            # outside of the working directory, mirror the absolute path
+            rel = os.path.splitdrive(os.path.abspath(path))[1].lstrip(os.sep)
+        return os.path.join(self.directory, rel + ".npy")
+
+
+def _results(tasks, jobs, cache):
+    if jobs <= 1:
+        _init_worker(cache)
+        yield from map(query_file, tasks)
+    else:
+        with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(cache,)) as pool:
+            yield from pool.imap(query_file, tasks, chunksize=4)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="nkshow query",
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.strip().splitlines()[1:]),
+    )
+    parser.add_argument("paths", nargs="+", help="logs or glob patterns")
+    parser.add_argument("dict_path", help="path of the data in the logs, such as Energy")
+    parser.add_argument("--format", choices=["csv", "json", "npy"], default="csv")
+    parser.add_argument(
+        "-o", "--output", default=None, help="output file, or directory for npy"
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--no-cache", action="store_true", help="don't use the cache of converted logs"
+    )
+    args = parser.parse_args(argv)
+
+    paths = expand_paths(args.paths)
+    if len(paths) == 0:
+        parser.error("no logs match the given paths")
+    if args.format == "npy" and args.output is None:
+        parser.error("--format npy needs an output directory (-o)")
+
+    if args.format == "npy":
+        writer = NpyWriter(args.output)
+        out = None
+    else:
+        out = sys.stdout.buffer if args.output is None else open(args.output, "wb")
+        writer = CsvWriter(out) if args.format == "csv" else JsonWriter(out)
+
+    n_errors = 0
+    tasks = ((path, args.dict_path) for path in paths)
+    try:
+        for path, cols, error in _results(tasks, args.jobs, not args.no_cache):
+            if error is None:
+                try:
+                    writer.write(path, cols)
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                print(f"{path}: {error}", file=sys.stderr)
+                n_errors += 1
+    finally:
+        if out is not None and out is not sys.stdout.buffer:
+            out.close()
+
+    return 1 if n_errors > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,9 @@
-from .plot import PlotextMixin
+from .plot import PlotextMixin, RenderPool, build_canvas
 from .directory_tree import DirectoryTree, JsonClick, FileClick
 from .table_view import TableView
 from .plot_panel import PlotPanel
 from .plot_controller import PlotController
+from .stats_panel import StatsPanel
+from .scheduler import RedrawScheduler, scheduler
 
 # from .figlet_text import Figlet
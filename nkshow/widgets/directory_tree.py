@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import asyncio
+from bisect import bisect
+from collections import deque
 from dataclasses import dataclass
 from functools import lru_cache, partial
 from os import scandir
@@ -16,15 +19,21 @@ from rich.align import Align
 
 from pathlib import Path
 
-from textual import events, log
+from textual import events
 from textual.message import Message
 from textual.reactive import Reactive
 from textual._types import MessageTarget
 from textual.widgets import TreeControl, TreeClick, TreeNode, NodeID
 from textual.widgets import Button, ButtonPressed
 
-from ..database import data as database
+from ..database import data as database, key_index, IndexBuilder
+from ..database.index import is_log, escape
+from ..instrumentation import trace
+from ..database.loading import LazyTree
+from ..database.hdf5 import H5Tree
+from ..database.mpack import MpackArray, MPACK_EXTENSIONS, is_mpack, payload_nbytes
 from ..filewatching import DirWatcher, observer
+from .scheduler import scheduler
 
 from watchdog import events
 
@@ -49,10 +58,12 @@ class FileEntry:
 
     @property
     def type(self):
-        if self.path.endswith((".log", ".json")):
+        if is_log(self.path):
             return 0
         elif self.path.endswith((".py", ".toml")):
             return 1
+        elif self.path.endswith(MPACK_EXTENSIONS):
+            return 3
         else:
             return 2
 
@@ -62,6 +73,19 @@ class JsonEntry:
     path: str
     file: str
     is_dir: bool
+    # shown dimmed after the label, such as the shape of an array
+    info: str = None
+
+
+@dataclass
+class MoreEntry:
+    """Stands for the children of a node that are not shown yet."""
+
+    remaining: int
+
+    @property
+    def is_dir(self):
+        return False
 
 
 @rich.repr.auto
@@ -88,16 +112,51 @@ class FixPlot(Message, bubble=True):
         super().__init__(sender)
 
 
+def format_bytes(n):
+    for unit in ["B", "kB", "MB", "GB"]:
+        if n < 1024 or unit == "GB":
+            break
+        n /= 1024
+    return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+
+
+def mpack_info(x):
+    """The shape, dtype and size of the arrays in a .mpack file, or the value of numbers."""
+    if isinstance(x, MpackArray):
+        shape = "x".join(f"{n}" for n in x.shape) if x.shape else "scalar"
+        return f"{shape} {x.dtype} {format_bytes(x.nbytes)}"
+    elif isinstance(x, dict):
+        return format_bytes(payload_nbytes(x))
+    else:
+        return f"= {x}"[:24]
+
+
 def file_type(entry):
     if entry.is_dir():
         return 1
-    elif entry.name.endswith(".log") or entry.name.endswith(".json"):
+    elif is_log(entry.name):
         return 0
     else:
         return 2
 
 
+def sort_key(data):
+    """The position of a DirEntry or FileEntry among its siblings."""
+    if data.is_dir:
+        typ = 1
+    elif is_log(data.path):
+        typ = 0
+    else:
+        typ = 2
+    return (typ, os.path.basename(data.path))
+
+
 class DirectoryTree(TreeControl[DirEntry]):
+    # Children are added chunk_size at a time, yielding to the event loop in
+    # between, and only page_size of them are shown until "more" is clicked.
+    chunk_size = 100
+    page_size = 500
+
     def __init__(self, path: str, name: str = None) -> None:
         self.path = path.rstrip("/")
         label = os.path.basename(self.path)
@@ -108,11 +167,33 @@ class DirectoryTree(TreeControl[DirEntry]):
         super().__init__(label, name=name, data=data)
         self.root.tree.guide_style = "black"
 
-        self._watchers = {}
-        self._to_refresh = []
+        # A single recursive watch on the root directory. Its events are
+        # queued by the observer thread and applied in batches by
+        # process_events, looking up the nodes by absolute path in _index.
+        self._watch = None
+        self._events = deque()
+        self._index = {os.path.abspath(self.path): self.root}
 
+        # (file, key path) -> True if plotted with the "+" button. Kept by
+        # path rather than node, as set_filter rebuilds the nodes.
         self._status = {}
 
+        # files being loaded in the background: node id -> progress
+        self._progress = {}
+        self._tasks = set()
+
+        # children not shown yet: id of the "more" node -> [(label, data)]
+        self._pending = {}
+
+        # The key index of the logs under the root, built in the background
+        # and used to show only the logs with a given key (see set_filter).
+        # _matches holds the absolute paths of the logs shown and of their
+        # directories, or None to show everything.
+        self.index_builder = IndexBuilder(key_index, cache=database.cache)
+        self.index_builder.subscribe(self._on_indexed)
+        self.filter = None
+        self._matches = None
+
     has_focus: Reactive[bool] = Reactive(False)
 
     def on_focus(self) -> None:
@@ -122,11 +203,15 @@ class DirectoryTree(TreeControl[DirEntry]):
         self.has_focus = False
 
     async def watch_hover_node(self, hover_node: NodeID) -> None:
+        # the mouse moves faster than the tree is drawn
+        scheduler.request((self, "hover"), self.show_hover)
+
+    def show_hover(self) -> None:
         for node in self.nodes.values():
             node.tree.guide_style = (
-                "bold not dim red" if node.id == hover_node else "black"
+                "bold not dim red" if node.id == self.hover_node else "black"
             )
-        log(f"refresh from hover")
+        trace("refresh from hover")
         self.refresh(layout=True)
 
     def render_node(self, node: TreeNode[DirEntry]) -> RenderableType:
@@ -138,10 +223,26 @@ class DirectoryTree(TreeControl[DirEntry]):
             node.is_cursor,
             node.id == self.hover_node,
             self.has_focus,
-            self._status.get(node.id, False),
+            self._is_fixed(node),
+            self._progress.get(node.id),
+            self.detail_label(node),
         )
         return label
 
+    def _is_fixed(self, node: TreeNode) -> bool:
+        if not isinstance(node.data, JsonEntry):
+            return False
+        return self._status.get((node.data.file, node.data.path), False)
+
+    def detail_label(self, node: TreeNode[DirEntry]) -> str:
+        if isinstance(node.data, FileEntry) and node.loaded:
+            usage = database.memory_usage(node.data.path)
+            if usage > 0:
+                return format_bytes(usage)
+        elif isinstance(node.data, JsonEntry):
+            return node.data.info
+        return None
+
     @lru_cache(maxsize=1024 * 32)
     def render_tree_label(
         self,
@@ -152,6 +253,8 @@ class DirectoryTree(TreeControl[DirEntry]):
         is_hover: bool,
         has_focus: bool,
         highlight: bool,
+        progress: float = None,
+        detail: str = None,
     ) -> RenderableType:
         meta = {
             "@click": f"click_label({node.id})",
@@ -168,7 +271,10 @@ class DirectoryTree(TreeControl[DirEntry]):
 
         if is_hover:
             label.stylize("underline")
-        if is_dir:
+        if isinstance(node.data, MoreEntry):
+            label.stylize("dim italic")
+            icon = "⋯"
+        elif is_dir:
             label.stylize("bold magenta")
             icon = "📂" if expanded else "📁"
         else:
@@ -188,14 +294,22 @@ class DirectoryTree(TreeControl[DirEntry]):
                     icon = "💾"
                 elif typ == 1:
                     icon = "📝"
+                elif typ == 3:
+                    icon = "📦"
                 else:
                     icon = "📄"
 
+        if progress is not None:
+            icon = "⏳"
+            label.append(f" {progress:.0%}", style="dim")
+        elif detail is not None:
+            label.append(f" {detail}", style="dim")
+
         if label.plain.startswith("."):
             label.stylize("dim")
 
         if isinstance(node, DirEntry) and not is_dir:
-            if not (label.plain.endswith(".log") or label.plain.endswith(".json")):
+            if not is_log(label.plain):
                 label.stylize("dim")
 
         if is_cursor and has_focus:
@@ -213,35 +327,102 @@ class DirectoryTree(TreeControl[DirEntry]):
             return table
 
     async def on_mount(self, event: events.Mount) -> None:
-        log(f"OnMount: loading directory {self.root}")
+        trace("OnMount: loading directory %s", self.root)
         await self.load_obj(self.root)
-        self.set_interval(5, self.process_events)
-        self.refresh(layout=True)
+        if isinstance(self.root.data, DirEntry):
+            handler = DirWatcher(self._events.append)
+            self._watch = observer.schedule(
+                handler, os.path.abspath(self.path), recursive=True
+            )
+            self.index_builder.scan_in_background(self.path)
+            self.index_builder.start()
+        self.set_interval(1, self.process_events)
+        scheduler.refresh(self, layout=True)
+
+    def _add_node(self, parent: TreeNode, label, data, position=None) -> TreeNode:
+        # As TreeControl.add, but without refreshing: add_children refreshes
+        # once per chunk instead of once per node. Uses the internals of
+        # textual 0.1.18's TreeNode, which setup.py pins.
+        self.id = NodeID(self.id + 1)
+        child_tree = parent._tree.add(label)
+        child = TreeNode(parent, self.id, self, child_tree, label, data)
+        if position is None:
+            parent.children.append(child)
+        else:
+            parent._tree.children.insert(position, parent._tree.children.pop())
+            parent.children.insert(position, child)
+        child_tree.label = child
+        self.nodes[self.id] = child
+        parent._empty = False
+        if isinstance(data, (DirEntry, FileEntry)):
+            self._index[os.path.abspath(data.path)] = child
+        return child
+
+    def _remove_node(self, node: TreeNode) -> None:
+        for child in list(node.children):
+            self._remove_node(child)
+        parent = node.parent
+        parent.children.remove(node)
+        parent._tree.children.remove(node._tree)
+        del self.nodes[node.id]
+        self._pending.pop(node.id, None)
+        if node.id in self._progress:
+            del self._progress[node.id]
+            database.cancel_load(node.data.path)
+        if isinstance(node.data, (DirEntry, FileEntry)):
+            self._index.pop(os.path.abspath(node.data.path), None)
+        if self.cursor == node.id:
+            self.cursor = parent.id
+
+    async def add_children(self, node: TreeNode, entries: list) -> None:
+        """
+        Adds a child to `node` for each (label, data) in `entries`. Only the
+        first page_size are added, followed by a "more" node which adds the
+        next page when clicked.
+        """
+        page, rest = entries[: self.page_size], entries[self.page_size :]
+        for i in range(0, len(page), self.chunk_size):
+            for label, data in page[i : i + self.chunk_size]:
+                self._add_node(node, label, data)
+            scheduler.refresh(self, layout=True)
+            # let input be processed, the tree is drawn at the next frame
+            await asyncio.sleep(0)
+
+        if rest:
+            self._set_pending(node, rest)
+            scheduler.refresh(self, layout=True)
+
+    async def load_more(self, node: TreeNode[MoreEntry]) -> None:
+        rest = self._pending.pop(node.id, None)
+        if rest is None:
+            return
+        parent = node.parent
+        if self.cursor == node.id:
+            self.cursor = (node.previous_sibling or parent).id
+        self._remove_node(node)
+        await self.add_children(parent, rest)
 
     async def load_directory(self, node: TreeNode[DirEntry]):
-        log(f"Loading directory {node.data.path}")
+        trace("Loading directory %s", node.data.path)
         path = node.data.path
         directory = sorted(
             list(scandir(path)), key=lambda entry: (file_type(entry), entry.name)
         )
-        for entry in directory:
-            log(f"Loading entry {entry}")
-            if entry.is_dir():
-                await node.add(entry.name, DirEntry(entry.path))
-            else:
-                await node.add(entry.name, FileEntry(entry.path))
-
-        if node not in self._watchers:
-            handler = DirWatcher(lambda ev: self.refresh_dir(node, ev))
-            self._watchers[node] = observer.schedule(handler, path, recursive=False)
-
+        entries = [
+            (entry.name, DirEntry(entry.path) if entry.is_dir() else FileEntry(entry.path))
+            for entry in directory
+        ]
+        entries = [(label, data) for label, data in entries if self._visible(data)]
+
+        # expand right away, so that the first chunk is shown while the
+        # others are added
         node.loaded = True
         await node.expand()
-        self.refresh(layout=True)
-        log(f"FINISHED directory {node.data.path} for {node}")
+        await self.add_children(node, entries)
+        trace("FINISHED directory %s for %s", node.data.path, node)
 
     async def load_json(self, node: TreeNode[DirEntry]):
-        log(f"Loading file {node.data.path}")
+        trace("Loading file %s", node.data.path)
         path = node.data.path
         if isinstance(node.data, FileEntry):
             file = path
@@ -256,14 +437,23 @@ class DirectoryTree(TreeControl[DirEntry]):
         else:
             ks = list(range(len(data)))
 
-        ks = sorted(ks, key=lambda entry: (not isinstance(data[entry], dict), entry))
+        # Don't convert the children of lazy trees just to list them
+        if isinstance(data, (LazyTree, H5Tree)):
+            is_dir = data.is_branch
+        else:
+            is_dir = lambda k: isinstance(data[k], dict)
+
+        ks = sorted(ks, key=lambda entry: (not is_dir(entry), entry))
+        entries = []
         for k in ks:
             full_path = f"{k}" if path is None else f"{path}/{k}"
-            await node.add(k, JsonEntry(full_path, file, isinstance(data[k], dict)))
+            # the values of .mpack files are only headers, cheap to describe
+            info = mpack_info(data[k]) if is_mpack(file) else None
+            entries.append((k, JsonEntry(full_path, file, is_dir(k), info)))
 
         node.loaded = True
-        self.refresh(layout=True)
-        log(f"FINISHED file {node.data.path}")
+        await self.add_children(node, entries)
+        trace("FINISHED file %s", node.data.path)
 
     def load_obj(self, node):
         if isinstance(node.data, JsonEntry):
@@ -276,38 +466,206 @@ class DirectoryTree(TreeControl[DirEntry]):
         else:
             return self.load_directory(node)
 
-    def refresh_dir(self, path, event):
-        self._to_refresh.append((path, event))
+    def _more_node(self, node: TreeNode):
+        if node.children and isinstance(node.children[-1].data, MoreEntry):
+            return node.children[-1]
+        return None
+
+    def _set_pending(self, parent: TreeNode, rest: list) -> None:
+        # Replaces the "more" node of parent, as labels are cached per node
+        more = self._more_node(parent)
+        if more is not None:
+            self._remove_node(more)
+        if rest:
+            more = self._add_node(parent, f"{len(rest)} more", MoreEntry(len(rest)))
+            self._pending[more.id] = rest
+
+    def _insert_path(self, path: str) -> None:
+        """Adds a node for the new file or directory at `path`, if its parent is shown."""
+        parent = self._index.get(os.path.dirname(path))
+        if parent is None or not parent.loaded or path in self._index:
+            return
+
+        name = os.path.basename(path)
+        data = DirEntry(path) if os.path.isdir(path) else FileEntry(path)
+        if not self._visible(data):
+            return
+        key = sort_key(data)
+
+        more = self._more_node(parent)
+        shown = parent.children[:-1] if more is not None else parent.children
+        keys = [sort_key(child.data) for child in shown]
+        if more is not None and (not keys or key > keys[-1]):
+            # belongs to a page that is not shown yet
+            rest = self._pending[more.id]
+            rest.insert(bisect([sort_key(d) for _, d in rest], key), (name, data))
+            self._set_pending(parent, rest)
+            return
+
+        self._add_node(parent, name, data, position=bisect(keys, key))
+
+    def _remove_path(self, path: str) -> None:
+        node = self._index.get(path)
+        if node is not None and node is not self.root:
+            self._remove_node(node)
+            return
+
+        # it might be in a page that is not shown yet
+        parent = self._index.get(os.path.dirname(path))
+        more = self._more_node(parent) if parent is not None else None
+        if more is not None:
+            rest = self._pending[more.id]
+            kept = [(n, d) for n, d in rest if os.path.abspath(d.path) != path]
+            if len(kept) != len(rest):
+                self._set_pending(parent, kept)
 
     async def process_events(self) -> None:
-        while len(self._to_refresh) > 0:
-            node, event = self._to_refresh.pop()
-            log(f"processing event {node} : {event}")
-            if isinstance(event, events.FileMovedEvent):
-                pass
-            elif isinstance(event, events.FileCreatedEvent):
-                full_path = event.src_path
-                if os.path.isdir(full_path):
-                    await node.add(Path(full_path).name, DirEntry(full_path))
-                else:
-                    await node.add(Path(full_path).name, FileEntry(full_path))
+        """Applies the file system events received since the last call."""
+        if not self._events:
+            return
+
+        while self._events:
+            event = self._events.popleft()
+            trace("processing event %s", event)
+            if isinstance(event, (events.FileMovedEvent, events.DirMovedEvent)):
+                self._remove_path(os.path.abspath(event.src_path))
+                self._insert_path(os.path.abspath(event.dest_path))
+            elif isinstance(event, (events.FileCreatedEvent, events.DirCreatedEvent)):
+                self._insert_path(os.path.abspath(event.src_path))
+            elif isinstance(event, (events.FileDeletedEvent, events.DirDeletedEvent)):
+                self._remove_path(os.path.abspath(event.src_path))
+            # modifications of loaded files are handled by the database
+            self._update_index(event)
+
+        scheduler.refresh(self, layout=True)
+
+    def _update_index(self, event) -> None:
+        builder = self.index_builder
+        if isinstance(event, events.DirMovedEvent):
+            builder.remove(event.src_path)
+            builder.scan_in_background(event.dest_path)
+        elif isinstance(event, events.DirDeletedEvent):
+            builder.remove(event.src_path)
+        elif isinstance(event, events.FileMovedEvent):
+            if is_log(event.src_path):
+                builder.remove(event.src_path)
+            if is_log(event.dest_path):
+                builder.queue(event.dest_path)
+        elif isinstance(event, events.FileDeletedEvent):
+            if is_log(event.src_path):
+                builder.remove(event.src_path)
+        elif isinstance(event, (events.FileCreatedEvent, events.FileModifiedEvent)):
+            if is_log(event.src_path):
+                builder.queue(event.src_path)
+
+    def _visible(self, data) -> bool:
+        return self._matches is None or os.path.abspath(data.path) in self._matches
+
+    def _match(self, pattern) -> set:
+        root = os.path.abspath(self.path)
+        matches = {root}
+        for path in key_index.files_with(pattern, root):
+            while path not in matches:
+                matches.add(path)
+                path = os.path.dirname(path)
+        return matches
+
+    async def set_filter(self, key) -> int:
+        """
+        Shows only the logs with the key path `key` (such as "Energy"),
+        according to the key index, and the directories containing them.
+        Logs are added as they are indexed. A key of None shows everything
+        again. Returns the number of logs shown.
+        """
+        if not isinstance(self.root.data, DirEntry):
+            return 0
+        self.filter = key
+        self._matches = None if key is None else self._match(escape(key))
+
+        for child in list(self.root.children):
+            self._remove_node(child)
+        self.root.loaded = False
+        await self.load_directory(self.root)
+        scheduler.refresh(self, layout=True)
+
+        if self._matches is None:
+            return 0
+        return sum(1 for path in self._matches if is_log(path))
+
+    def _on_indexed(self, path: str) -> None:
+        # keeps the filtered tree up to date as logs are indexed or removed
+        if self.filter is None:
+            return
+        matched = key_index.has_key(path, escape(self.filter))
+        if matched and path not in self._matches:
+            new = []
+            parent = path
+            while parent not in self._matches:
+                self._matches.add(parent)
+                new.append(parent)
+                parent = os.path.dirname(parent)
+            # directories first, so that the log is added if they are expanded
+            for p in reversed(new):
+                self._insert_path(p)
+            scheduler.refresh(self, layout=True)
+        elif not matched and path in self._matches:
+            self._matches = self._match(escape(self.filter))
+            self._remove_path(path)
+            scheduler.refresh(self, layout=True)
+
+    async def open_file(self, node: TreeNode[FileEntry]) -> None:
+        """Loads a file in the background, showing the progress on its node."""
+        path = node.data.path
+
+        def progress(fraction):
+            if node.id in self._progress:
+                self._progress[node.id] = fraction
+                scheduler.refresh(self, layout=True)
+
+        self._progress[node.id] = 0.0
+        scheduler.refresh(self, layout=True)
+        success = await database.load_file_async(path, progress)
+
+        if node.id not in self._progress:
+            # cancelled by cancel_loading
+            return
+        del self._progress[node.id]
+        scheduler.refresh(self, layout=True)
+
+        if success:
+            if not node.loaded:
+                await self.load_json(node)
+            await node.expand()
+        else:
+            await self.emit(FileClick(self, path))
+
+    def cancel_loading(self, keep: NodeID = None) -> None:
+        """Cancels the background loading of all files except `keep`."""
+        for node_id in list(self._progress.keys()):
+            if node_id != keep:
+                del self._progress[node_id]
+                database.cancel_load(self.nodes[node_id].data.path)
+        scheduler.refresh(self, layout=True)
 
     async def handle_tree_click(self, message: TreeClick[DirEntry]) -> None:
         dir_entry = message.node.data
-        log(f"processsing click on {dir_entry}")
+        trace("processsing click on %s", dir_entry)
+
+        self.cancel_loading(keep=message.node.id)
 
-        if isinstance(dir_entry, JsonEntry) and not dir_entry.is_dir:
-            log(f" -> sending CLICK {dir_entry}")
+        if isinstance(dir_entry, MoreEntry):
+            await self.load_more(message.node)
+        elif isinstance(dir_entry, JsonEntry) and not dir_entry.is_dir:
+            trace(" -> sending CLICK %s", dir_entry)
             await self.emit(JsonClick(self, dir_entry.file, dir_entry.path))
         elif isinstance(dir_entry, FileEntry):
-            if database.load_file(message.node.data.path):
-                if not message.node.loaded:
-                    await self.load_obj(message.node)
-                    await message.node.expand()
-                else:
-                    await message.node.toggle()
-            else:
-                await self.emit(FileClick(self, dir_entry.path))
+            if message.node.loaded:
+                await message.node.toggle()
+            elif message.node.id not in self._progress:
+                # Don't block the event loop while the file is parsed
+                task = asyncio.ensure_future(self.open_file(message.node))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
         else:
             if not message.node.loaded:
                 await self.load_obj(message.node)
@@ -316,17 +674,16 @@ class DirectoryTree(TreeControl[DirEntry]):
                 await message.node.toggle()
 
     async def action_click_btn(self, node_id: NodeID) -> None:
-        log(f" -> sending CLICKBTN {node_id}")
+        trace(" -> sending CLICKBTN %s", node_id)
         node = self.nodes[node_id]
-        self._status[node_id] = not self._status.get(node_id, False)
-        await self.post_message(
-            FixPlot(self, node.data.file, node.data.path, self._status[node_id])
-        )
+        fixed = not self._is_fixed(node)
+        self._status[(node.data.file, node.data.path)] = fixed
+        await self.post_message(FixPlot(self, node.data.file, node.data.path, fixed))
 
     async def clear_activated(self):
         for k in self._status.keys():
             self._status[k] = False
-        self.refresh()
+        scheduler.refresh(self)
 
 
 if __name__ == "__main__":
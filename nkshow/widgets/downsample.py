@@ -0,0 +1,106 @@
+import numpy as np
+
+
+def _min_max_sources(y):
+    # Real values in which NaNs never win a min/max comparison
+    y = np.real(y).astype(np.float64, copy=False)
+    nans = np.isnan(y)
+    if nans.any():
+        return np.where(nans, np.inf, y), np.where(nans, -np.inf, y)
+    return y, y
+
+
+def minmax_indices(y, n_out, start=0, stop=None):
+    """The sorted indices of the min and max of `y[start:stop]` in each of `n_out` buckets."""
+    stop = len(y) if stop is None else stop
+    count = stop - start
+    if count <= 2 * n_out:
+        return np.arange(start, stop)
+
+    ymin, ymax = _min_max_sources(y[start:stop])
+    size = -(-count // n_out)
+    n_buckets = -(-count // size)
+    pad = n_buckets * size - count
+
+    ymin = np.concatenate([ymin, np.full(pad, np.inf)]).reshape(n_buckets, size)
+    ymax = np.concatenate([ymax, np.full(pad, -np.inf)]).reshape(n_buckets, size)
+
+    offsets = np.arange(n_buckets) * size + start
+    idx = np.stack([ymin.argmin(axis=1), ymax.argmax(axis=1)], axis=1)
+    idx = np.sort(idx, axis=1) + offsets[:, None]
+    return idx.ravel()
+
+
+def minmax_downsample(x, y, n_out, start=0, stop=None):
+    """Returns the points of `(x, y)` selected by minmax_indices."""
+    idx = minmax_indices(y, n_out, start, stop)
+    return x[idx], y[idx]
+
+
+class MinMaxPyramid:
+    """
+    The indices of the min and max of a series over blocks of 2, 4, 8, ...
+    points, to downsample any range of it in O(n_out).
+    """
+
+    def __init__(self, y):
+        self.n = len(y)
+        ymin, ymax = _min_max_sources(y)
+        self._ymin = ymin
+        self._ymax = ymax
+
+        # levels[j] holds the indices for blocks of 2**(j+1) points
+        self.levels = []
+        lo = hi = np.arange(self.n)
+        while len(lo) > 1:
+            m = len(lo) // 2 * 2
+            lo_a, lo_b = lo[0:m:2], lo[1:m:2]
+            hi_a, hi_b = hi[0:m:2], hi[1:m:2]
+            new_lo = np.where(ymin[lo_b] < ymin[lo_a], lo_b, lo_a)
+            new_hi = np.where(ymax[hi_b] > ymax[hi_a], hi_b, hi_a)
+            if m < len(lo):
+                # the last block is incomplete
+                new_lo = np.append(new_lo, lo[-1])
+                new_hi = np.append(new_hi, hi[-1])
+            lo, hi = new_lo, new_hi
+            self.levels.append((lo, hi))
+
+    def _edge(self, start, stop):
+        if stop <= start:
+            return np.empty(0, dtype=np.intp)
+        return np.array(
+            [start + self._ymin[start:stop].argmin(), start + self._ymax[start:stop].argmax()]
+        )
+
+    def indices(self, n_out, start=0, stop=None):
+        """The sorted indices of about `2 * n_out` minima and maxima in `[start, stop)`."""
+        stop = self.n if stop is None else min(stop, self.n)
+        start = max(start, 0)
+        count = stop - start
+        if count <= 2 * n_out:
+            return np.arange(start, stop)
+
+        # coarsest level that still has at least n_out blocks in the range
+        level = int(np.log2(count / n_out)) - 1
+        level = min(max(level, 0), len(self.levels) - 1)
+        size = 2 ** (level + 1)
+        lo, hi = self.levels[level]
+
+        b0 = -(-start // size)
+        b1 = stop // size
+        if b1 <= b0:
+            return self._edge(start, stop)
+
+        idx = np.concatenate(
+            [
+                self._edge(start, b0 * size),
+                lo[b0:b1],
+                hi[b0:b1],
+                self._edge(b1 * size, stop),
+            ]
+        )
+        return np.unique(idx)
+
+    def downsample(self, x, y, n_out, start=0, stop=None):
+        idx = self.indices(n_out, start, stop)
+        return x[idx], y[idx]
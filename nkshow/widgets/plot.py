@@ -1,42 +1,172 @@
-from rich.layout import Layout
-from rich.live import Live
-from rich.ansi import AnsiDecoder
+import asyncio
+
 from rich.console import Group
 from rich.jupyter import JupyterMixin
-from rich.panel import Panel
 from rich.text import Text
 
-from textual import log
+import numpy as np
 
-from time import sleep
-import plotext as plt
+from .downsample import MinMaxPyramid, minmax_indices
+from ..canvas import build_canvas, render_lines
+from ..database.hdf5 import LazyDataset
+from ..instrumentation import trace, timed
+from ..workers import process_pool
 
-import numpy as np
+
+class RenderPool:
+    """Builds the canvases of downsampled series in worker processes."""
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._executor = None
+
+    async def render(self, spec):
+        if self._executor is None:
+            self._executor = process_pool(self.max_workers)
+        return await asyncio.wrap_future(self._executor.submit(render_lines, spec))
+
+
+render_pool = RenderPool()
 
 
 class PlotextMixin(JupyterMixin):
     def __init__(self, phase=0, title=""):
-        self.decoder = AnsiDecoder()
         self.phase = phase
         self.title = title
         self.data = []
+        # (xdata, lower, upper, label) of the bands drawn behind the data
+        self.bands = []
+        # range of iterations to show, or None to show everything
+        self.xlim = None
+
+        # versions of the data, set together with it, to know when the
+        # canvas has to be rebuilt
+        self.versions = None
+        # (files, path, key, band kind) of the aggregated series, which
+        # their labels do not tell apart
+        self.aggregates = ()
+
+        # label -> (ydata, pyramid)
+        self._pyramids = {}
+
+        self._canvas_key = None
+        self.rich_canvas = None
+
+        # If set, canvases are built in this RenderPool and on_ready is
+        # called when one is available. Meanwhile, the previous one is shown.
+        self.pool = None
+        self.on_ready = None
+        self._pending_key = None
+        self._tasks = set()
+
+    def canvas_key(self, width, height):
+        return (
+            self.versions,
+            self.aggregates,
+            tuple(label for (_, _, label) in self.data),
+            tuple(label for (_, _, _, label) in self.bands),
+            width,
+            height,
+            self.phase,
+            self.title,
+            self.xlim,
+            getattr(self, "ylim", None),
+        )
 
     def __rich_console__(self, console, options):
         self.width = options.max_width or console.width
         self.height = options.height or console.height
-        log(f"plotting with {self.width} and {self.height}")
-        canvas = self.make_plot(self.width, self.height, self.phase, self.title)
-        self.rich_canvas = Group(*self.decoder.decode(canvas))
-        yield self.rich_canvas
 
-    def make_plot(self, width, height, phase=0, title=""):
-        plt.clf()
+        # Focus, hover and border changes of the containing panel re-render
+        # us with the same data and size: reuse the canvas in that case.
+        key = self.canvas_key(self.width, self.height)
+        if self.versions is None or key != self._canvas_key:
+            trace("plotting with %s and %s", self.width, self.height)
+            spec = self.plot_spec(self.width, self.height, self.title)
+            if self.pool is None or self.versions is None:
+                with timed("render", width=self.width, height=self.height):
+                    self.rich_canvas = Group(*render_lines(spec))
+                self._canvas_key = key
+            elif key != self._pending_key:
+                self._pending_key = key
+                task = asyncio.ensure_future(self._render_async(key, spec))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        yield self.rich_canvas if self.rich_canvas is not None else Text("")
+
+    async def _render_async(self, key, spec):
+        try:
+            with timed("render_async", width=spec["width"], height=spec["height"]):
+                lines = await self.pool.render(spec)
+        except Exception as e:
+            # such as a broken pool: build it here instead
+            trace("Rendering in the pool failed: %s", e)
+            lines = render_lines(spec)
+        if key != self._pending_key:
+            # a newer canvas was requested meanwhile
+            return
+        self.rich_canvas = Group(*lines)
+        self._canvas_key = key
+        self._pending_key = None
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def pyramid(self, label, ydata):
+        pyramid = self._pyramids.get(label)
+        if pyramid is None or pyramid[0] is not ydata:
+            pyramid = (ydata, MinMaxPyramid(ydata))
+            self._pyramids[label] = pyramid
+        return pyramid[1]
+
+    def downsample(self, label, xdata, ydata, width):
+        """The points of (xdata, ydata) within xlim that can be seen `width` columns wide."""
+        start, stop = self.x_range(xdata)
+        if isinstance(ydata, LazyDataset) and ydata.nbytes == 0:
+            # an HDF5 dataset not in memory: read only the slice shown
+            y = ydata[start:stop]
+            idx = minmax_indices(y, width)
+            return np.asarray(xdata)[start:stop][idx], y[idx]
+        return self.pyramid(label, ydata).downsample(xdata, ydata, width, start, stop)
+
+    def x_range(self, xdata):
+        """Indices of the first and last+1 points of `xdata` within xlim."""
+        if self.xlim is None:
+            return 0, len(xdata)
+        xdata = np.asarray(xdata).real
+        return (
+            np.searchsorted(xdata, self.xlim[0], side="left"),
+            np.searchsorted(xdata, self.xlim[1], side="right"),
+        )
+
+    def plot_spec(self, width, height, title=""):
+        """The arguments of build_canvas, with the series downsampled to `width` columns."""
+        series = []
+        bands = []
+        labels = set()
+        for (xdata, lower, upper, label) in self.bands:
+            for edge, name in ((lower, "lower"), (upper, "upper")):
+                labels.add(f"{label}/{name}")
+                x, y = self.downsample(f"{label}/{name}", xdata, edge, width)
+                if len(x) > 0:
+                    bands.append((x.real, y.real))
         for (xdata, ydata, label) in self.data:
-            plt.plot(xdata.real, ydata.real, label=label)
-        plt.plotsize(width, height)
-        plt.title(title)
-        plt.theme("dark")
-        if hasattr(self, "ylim") and self.ylim is not None:
-            plt.ylim(*self.ylim)
-        # plt.cls()
-        return plt.build()
+            labels.add(label)
+            # There is no point in plotting more than a min and a max per column
+            x, y = self.downsample(label, xdata, ydata, width)
+            if len(x) > 0:
+                series.append((x.real, y.real, label))
+        for label in set(self._pyramids.keys()) - labels:
+            del self._pyramids[label]
+
+        return dict(
+            series=series,
+            bands=bands,
+            width=width,
+            height=height,
+            title=title,
+            xlim=self.xlim,
+            ylim=getattr(self, "ylim", None),
+        )
+
+    def make_plot(self, width, height, title=""):
+        return build_canvas(**self.plot_spec(width, height, title))
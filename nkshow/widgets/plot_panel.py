@@ -10,14 +10,16 @@ from rich.traceback import Traceback
 
 from logging import getLogger
 
-from textual import events, log
+from textual import events
 from textual.geometry import Offset
 from textual.widget import Reactive, Widget
 
 import numpy as np
 
-from .plot import PlotextMixin
-from ..database import data as database
+from .plot import PlotextMixin, render_pool
+from .scheduler import scheduler
+from ..database import data as database, Aggregate, History, Smoothing
+from ..instrumentation import trace, timed
 
 
 @rich.repr.auto(angular=False)
@@ -31,12 +33,30 @@ class PlotPanel(Widget, can_focus=True):
         super().__init__(name=name)
 
         self._plot = PlotextMixin()
+        # the canvas is built in worker processes, and shown when ready
+        self._plot.pool = render_pool
+        self._plot.on_ready = lambda: scheduler.refresh(self)
 
         self.renderable = self._plot
 
         self._plot_keys_fixed = []
         self._plot_keys_last = []
 
+        # If True, the same quantity plotted from several files is shown as
+        # a single series with the mean and interquartile band of the runs
+        self.aggregate = False
+        # the band around the mean of the runs, one of Aggregate.bands
+        self.aggregate_band = Aggregate.bands[0]
+
+        # If True, the Mean of netket statistics is shown with its error band
+        self.error_bands = False
+
+        # Rolling mean or exponential moving average of the single series
+        self.smoothing = Smoothing()
+
+        database.subscribe(self.on_file_loaded)
+        database.subscribe_dirty(self.on_file_changed)
+
     def __rich_repr__(self) -> rich.repr.Result:
         yield "name", self.name
 
@@ -61,37 +81,197 @@ class PlotPanel(Widget, can_focus=True):
     async def on_leave(self, event: events.Leave) -> None:
         self.mouse_over = False
 
+    async def on_key(self, event: events.Key) -> None:
+        if event.key in ("+", "="):
+            self.zoom(0.5)
+        elif event.key == "-":
+            self.zoom(2.0)
+        elif event.key == "0":
+            self.zoom(None)
+        else:
+            await self.dispatch_key(event)
+
+    async def key_left(self, event: events.Key) -> None:
+        self.pan(-0.25)
+
+    async def key_right(self, event: events.Key) -> None:
+        self.pan(0.25)
+
+    async def on_mouse_scroll_up(self, event: events.MouseScrollUp) -> None:
+        self.zoom(0.8)
+
+    async def on_mouse_scroll_down(self, event: events.MouseScrollDown) -> None:
+        self.zoom(1.25)
+
+    def x_extent(self):
+        xs = [x.real for (x, _, _) in self._plot.data if len(x) > 0]
+        if len(xs) == 0:
+            return None
+        return min(x[0] for x in xs), max(x[-1] for x in xs)
+
+    def zoom(self, factor):
+        """Zooms the iteration range by `factor`, or shows everything if None."""
+        extent = self.x_extent()
+        if factor is None or extent is None:
+            self._plot.xlim = None
+        else:
+            lo, hi = self._plot.xlim or extent
+            center, half = (lo + hi) / 2, (hi - lo) / 2 * factor
+            if 2 * half >= extent[1] - extent[0]:
+                self._plot.xlim = None
+            else:
+                self._plot.xlim = (center - half, center + half)
+        scheduler.refresh(self)
+
+    def pan(self, fraction):
+        """Moves the iteration range by `fraction` of its width."""
+        if self._plot.xlim is None:
+            return
+        lo, hi = self._plot.xlim
+        shift = (hi - lo) * fraction
+        self._plot.xlim = (lo + shift, hi + shift)
+        scheduler.refresh(self)
+
     async def fix_plot_data(self, file, path, xlabel, ylabel, clear=False):
         if clear:
             self._plot_keys_fixed = []
         self._plot_keys_fixed.append((file, path, (xlabel, ylabel)))
-        await self.update_plot()
+        self.invalidate()
 
     async def unfix_plot_data(self, file, path, xlabel, ylabel):
         self._plot_keys_fixed.remove((file, path, (xlabel, ylabel)))
-        await self.update_plot()
+        self.invalidate()
 
     async def set_plot_data(self, file, path, xlabel, ylabel, clear=False):
         if clear:
             self._plot_keys = []
         self._plot_keys_last = (file, path, (xlabel, ylabel))
-        await self.update_plot()
+        self.invalidate()
+
+    def plot_keys(self):
+        if self._plot_keys_last in self._plot_keys_fixed:
+            return self._plot_keys_fixed
+        else:
+            return self._plot_keys_fixed + [self._plot_keys_last]
+
+    def group_runs(self, plot_keys):
+        """
+        Splits `plot_keys` into the keys to plot as they are and, if
+        aggregating, a dictionary mapping (path, ylabel) to the files in
+        which that quantity is plotted against the iterations, if more than one.
+        """
+        if not self.aggregate:
+            return plot_keys, {}
+
+        groups = {}
+        for (file, path, (xlabel, ylabel)) in plot_keys:
+            if xlabel == "iters":
+                groups.setdefault((path, ylabel), {})[file] = None
+        groups = {k: list(files) for k, files in groups.items() if len(files) > 1}
+
+        single = [
+            (file, path, (xlabel, ylabel))
+            for (file, path, (xlabel, ylabel)) in plot_keys
+            if xlabel != "iters" or (path, ylabel) not in groups
+        ]
+        return single, groups
+
+    async def toggle_error_bands(self):
+        self.error_bands = not self.error_bands
+        self.invalidate()
+
+    async def toggle_aggregate(self):
+        self.aggregate = not self.aggregate
+        self.invalidate()
+
+    async def cycle_aggregate_band(self):
+        bands = Aggregate.bands
+        self.aggregate_band = bands[(bands.index(self.aggregate_band) + 1) % len(bands)]
+        self.invalidate()
+
+    async def cycle_smoothing(self):
+        self.smoothing.cycle_mode()
+        self.invalidate()
+
+    async def scale_window(self, factor):
+        self.smoothing.set_window(self.smoothing.window * factor)
+        self.invalidate()
+
+    def is_plotted(self, path):
+        return any(key and key[0] == path for key in self.plot_keys())
+
+    async def on_file_loaded(self, path):
+        if self.is_plotted(path):
+            self.invalidate()
+
+    def on_file_changed(self, path):
+        # called from the file watcher thread: get_data in update_plot
+        # starts reloading the file, and the plot is updated again when
+        # it is loaded
+        if self.is_plotted(path):
+            scheduler.request_threadsafe((self, "plot"), self.update_plot)
+
+    def invalidate(self):
+        """Rebuilds the plot at the next frame of the scheduler."""
+        scheduler.request((self, "plot"), self.update_plot)
 
     async def update_plot(self):
-        log(f"Updating plots with {self._plot_keys_fixed}")
+        trace("Updating plots with %s", self._plot_keys_fixed)
         try:
             data = []
-            if self._plot_keys_last in self._plot_keys_fixed:
-                plot_keys = self._plot_keys_fixed
-            else:
-                plot_keys = self._plot_keys_fixed + [self._plot_keys_last]
-            for (file, path, (xlabel, ylabel)) in plot_keys:
+            bands = []
+            aggregates = []
+            # only histories are plotted, not arrays such as those of .mpack files
+            hists = {}
+            for key in self.plot_keys():
+                if key:
+                    hist = database.get_data(key[0], key[1])
+                    if isinstance(hist, History):
+                        hists[key] = hist
+            plot_keys = list(hists)
+            database.set_pinned(key[0] for key in plot_keys)
+            single, groups = self.group_runs(plot_keys)
+            smoothing = self.smoothing
+            with timed("update_plot", series=len(plot_keys)):
+                for (file, path, (xlabel, ylabel)) in single:
+                    hist = hists[(file, path, (xlabel, ylabel))]
+                    label = f"{file}/{path}/{ylabel}{smoothing.label()}"
+                    y, band = smoothing.apply((file, path, ylabel), hist[ylabel])
+                    data.append((hist[xlabel], y, label))
+
+                    stats = getattr(hist, "stats", None)
+                    if self.error_bands and band is not None:
+                        bands.append((hist[xlabel], *band, label))
+                    elif self.error_bands and ylabel == "Mean" and stats is not None:
+                        if stats.err is not None:
+                            bands.append((hist[xlabel], *stats.band(), label))
+
+                smoothed = [(file, path, ylabel) for (file, path, (_, ylabel)) in single]
+                for (path, ylabel), files in groups.items():
+                    agg = database.get_aggregate(files, path, ylabel)
+                    label = f"{path}/{ylabel} (mean of {len(files)}){smoothing.label()}"
+                    key = (tuple(files), path, ylabel)
+                    y, _ = smoothing.apply(key, agg["mean"], source=agg)
+                    data.append((agg.iters, y, label))
+
+                    # the band is smoothed as the mean it surrounds
+                    edges = []
+                    for edge, name in zip(agg.band(self.aggregate_band), ("lower", "upper")):
+                        edges.append(smoothing.apply(key + (name,), edge, source=agg)[0])
+                        smoothed.append(key + (name,))
+                    bands.append((agg.iters, *edges, label))
+                    smoothed.append(key)
+                    aggregates.append((tuple(sorted(files)), path, ylabel, self.aggregate_band))
 
-                hist = database.get_data(file, path)
-                log("PlotPanel: Loaded {file} {path}")
-                data.append((hist[xlabel], hist[ylabel], f"{file}/{path}/{ylabel}"))
+                smoothing.retain(smoothed)
+                database.retain_aggregates(
+                    (tuple(files), path, ylabel) for (path, ylabel), files in groups.items()
+                )
 
             self._plot.data = data
+            self._plot.bands = bands
+            self._plot.aggregates = tuple(aggregates)
+            self._plot.versions = tuple(database.version(key[0]) for key in plot_keys)
             content = self._plot
 
         except Exception:
@@ -104,4 +284,4 @@ class PlotPanel(Widget, can_focus=True):
 
     async def clear_plot(self):
         self._plot_keys_fixed = []
-        await self.update_plot()
+        self.invalidate()
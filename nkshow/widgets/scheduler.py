@@ -0,0 +1,93 @@
+import asyncio
+import inspect
+import time
+import traceback
+from functools import partial
+
+from .. import instrumentation
+from ..instrumentation import timed
+
+
+class RedrawScheduler:
+    """
+    Runs the redraws requested by the widgets in frames, at most `fps` per
+    second. A request replaces the pending one with the same key.
+    """
+
+    def __init__(self, fps=20):
+        self.fps = fps
+
+        # key -> callback, run at the next frame
+        self._pending = {}
+        self._handle = None
+        self._running = False
+        self._last = -float("inf")
+        self._loop = None
+        self._tasks = set()
+
+        # number of frames run and of requests dropped as obsolete
+        self.frames = 0
+        self.dropped = 0
+
+    def attach(self, loop=None):
+        """Sets the event loop of request_threadsafe, by default the running one."""
+        self._loop = loop or asyncio.get_running_loop()
+
+    def request(self, key, callback):
+        """Runs `callback`, possibly a coroutine function, at the next frame, from the event loop."""
+        if key in self._pending:
+            self.dropped += 1
+        self._pending[key] = callback
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        self._schedule()
+
+    def request_threadsafe(self, key, callback):
+        """As request, but can be called from any thread, once attached to a loop."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.request, key, callback)
+
+    def refresh(self, widget, layout=False):
+        """Refreshes `widget` at the next frame."""
+        if layout:
+            self.request((widget, "layout"), partial(widget.refresh, layout=True))
+        else:
+            self.request((widget, "refresh"), widget.refresh)
+
+    def _schedule(self):
+        if self._handle is not None or self._running or not self._pending:
+            return
+        delay = max(0.0, self._last + 1 / self.fps - time.monotonic())
+        self._handle = self._loop.call_later(delay, self._start_frame)
+
+    def _start_frame(self):
+        self._handle = None
+        task = asyncio.ensure_future(self.frame())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def frame(self):
+        """Runs the pending requests. Those made meanwhile wait for the next frame."""
+        self._running = True
+        self._last = time.monotonic()
+        jobs, self._pending = self._pending, {}
+        try:
+            with timed("frame", jobs=len(jobs)):
+                for key, callback in jobs.items():
+                    try:
+                        result = callback()
+                        if inspect.isawaitable(result):
+                            await result
+                    except Exception:
+                        # logged even without instrumentation, as the widget
+                        # stops updating
+                        instrumentation.error(
+                            "Redraw %s failed:\n%s", key, traceback.format_exc()
+                        )
+            self.frames += 1
+        finally:
+            self._running = False
+            self._schedule()
+
+
+scheduler = RedrawScheduler()
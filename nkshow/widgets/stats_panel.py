@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from rich.console import RenderableType
+from rich.panel import Panel
+from rich.table import Table
+
+from textual.widget import Widget
+
+from .. import instrumentation
+
+
+class StatsPanel(Widget):
+    """
+    Shows the timings recorded by nkshow.instrumentation for every stage,
+    refreshed every second while visible.
+    """
+
+    def __init__(self, *, name: str | None = None) -> None:
+        super().__init__(name=name)
+
+    async def on_mount(self, event) -> None:
+        self.set_interval(1, self.tick)
+
+    async def tick(self) -> None:
+        if self.visible:
+            self.refresh()
+
+    def render(self) -> RenderableType:
+        table = Table("stage", "count", "last ms", "mean ms", "max ms", "MB", expand=True)
+        for stage, s in sorted(instrumentation.stats.items()):
+            table.add_row(
+                stage,
+                f"{s.count}",
+                f"{s.last * 1000:.1f}",
+                f"{s.mean * 1000:.1f}",
+                f"{s.max * 1000:.1f}",
+                f"{s.nbytes / 2**20:.1f}" if s.nbytes else "",
+            )
+
+        if instrumentation.enabled:
+            title = "Timings"
+        else:
+            title = "Timings (disabled)"
+        return Panel(table, title=title)
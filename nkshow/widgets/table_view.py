@@ -1,74 +1,215 @@
 from __future__ import annotations
 
+import asyncio
+
+import numpy as np
+
 from rich.console import RenderableType
 from rich.padding import Padding, PaddingDimensions
 from rich.style import StyleType
 from rich.styled import Styled
 
+from rich.pretty import Pretty
 from rich.syntax import Syntax
 from rich.traceback import Traceback
 from rich.panel import Panel
 from rich.table import Table
 from rich.align import Align
 
-from textual import log
-from textual.widgets import Header, Footer, FileClick, ScrollView, Static
+from textual import events
+from textual.reactive import Reactive
+from textual.widget import Widget
 
 from ..database import data as database
+from ..database.mpack import MpackArray
+from ..instrumentation import trace
+from .scheduler import scheduler
+
+
+def format_column(values) -> list:
+    """Formats a slice of a column, as f"{values[i]}" would, in one call."""
+    values = np.asarray(values)
+    if values.dtype.kind in "biufc":
+        return np.char.mod("%s", values).tolist()
+    return [f"{v}" for v in values]
+
+
+class HistoryRows:
+    """The rows of a History, formatted only for the visible window."""
+
+    # lines taken by the panel borders and the table header
+    overhead = 6
+
+    def __init__(self, hist, title):
+        self.keys = ["iters"] + list(hist.keys())
+        self.columns = [hist[k] for k in self.keys]
+        self.title = title
+        self.n_lines = len(hist)
+
+    def render_window(self, start, count) -> RenderableType:
+        stop = min(start + count, self.n_lines)
+        table = Table(*self.keys)
+        cells = [format_column(col[start:stop]) for col in self.columns]
+        for row in zip(*cells):
+            table.add_row(*row)
+
+        subtitle = f"{start + 1}-{stop} of {self.n_lines}"
+        return Align.center(Panel(table, title=self.title, subtitle=subtitle))
+
+
+async def array_summary(array, title) -> RenderableType:
+    """The shape, dtype and statistics of a MpackArray, computed in a thread."""
+    table = Table("", "", show_header=False, box=None)
+    table.add_row("shape", f"{array.shape}")
+    table.add_row("dtype", f"{array.dtype}")
+    table.add_row("bytes", f"{array.nbytes}")
+    try:
+        loop = asyncio.get_running_loop()
+        stats = await loop.run_in_executor(None, array.stats)
+        for k, v in stats.items():
+            table.add_row(k, f"{v}")
+    except ValueError as e:
+        table.add_row("stats", f"{e}")
+    return Align.center(Panel(table, title=title))
+
+
+class FileLines:
+    """The lines of a text file, highlighted only for the visible window."""
+
+    overhead = 0
+
+    def __init__(self, path):
+        with open(path, "rt") as f:
+            self.code = f.read()
+        self.lexer = Syntax.guess_lexer(path, code=self.code)
+        self.n_lines = self.code.count("\n") + 1
+
+    def render_window(self, start, count) -> RenderableType:
+        return Syntax(
+            self.code,
+            self.lexer,
+            line_numbers=True,
+            word_wrap=True,
+            indent_guides=True,
+            theme="monokai",
+            line_range=(start + 1, start + count),
+        )
+
+
+class TableView(Widget, can_focus=True):
+    """
+    Shows the content of a History or of a text file, rendering only the
+    visible lines, so that the cost is independent of the length.
+    """
+
+    offset: Reactive[int] = Reactive(0)
+
+    def __init__(self, *, name: str | None = None) -> None:
+        super().__init__(name=name)
+        self._shown = None
+        self._content = None
+
+        database.subscribe(self.on_file_loaded)
+        database.subscribe_dirty(self.on_file_changed)
+
+    @property
+    def page_size(self) -> int:
+        overhead = getattr(self._content, "overhead", 0)
+        return max(1, self.size.height - overhead)
+
+    def validate_offset(self, value: int) -> int:
+        n_lines = getattr(self._content, "n_lines", 0)
+        return max(0, min(value, n_lines - self.page_size))
+
+    def render(self) -> RenderableType:
+        if self._content is None:
+            return ""
+        elif hasattr(self._content, "render_window"):
+            return self._content.render_window(self.offset, self.page_size)
+        else:
+            return self._content
+
+    async def update(self, content, home: bool = True) -> None:
+        self._content = content
+        self.offset = 0 if home else self.offset
+        self.refresh()
+
+    async def on_mouse_scroll_up(self, event: events.MouseScrollUp) -> None:
+        self.offset += 3
+
+    async def on_mouse_scroll_down(self, event: events.MouseScrollDown) -> None:
+        self.offset -= 3
+
+    async def on_key(self, event: events.Key) -> None:
+        await self.dispatch_key(event)
+
+    async def key_down(self) -> None:
+        self.offset += 1
+
+    async def key_up(self) -> None:
+        self.offset -= 1
+
+    async def key_pagedown(self) -> None:
+        self.offset += self.page_size
+
+    async def key_pageup(self) -> None:
+        self.offset -= self.page_size
+
+    async def key_home(self) -> None:
+        self.offset = 0
+
+    async def key_end(self) -> None:
+        self.offset = getattr(self._content, "n_lines", 0)
+
+    def is_shown(self, file) -> bool:
+        return self._shown is not None and self._shown[0] == file
+
+    async def on_file_loaded(self, file) -> None:
+        if self.is_shown(file):
+            scheduler.request((self, "data"), self.reload)
 
+    def on_file_changed(self, file) -> None:
+        # called from the file watcher thread
+        if self.is_shown(file):
+            scheduler.request_threadsafe((self, "data"), self.reload)
 
-class TableView(ScrollView):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    async def reload(self) -> None:
+        """Shows the latest data of the history shown, keeping the position."""
+        if self._shown is not None:
+            await self.show_data(*self._shown, home=False)
 
-    async def show_data(self, file, path) -> None:
+    async def show_data(self, file, path, home=True) -> None:
         """A message sent by the directory tree when a file is clicked."""
 
-        log(f"GOT message {file} {path}")
-
-        content: RenderableType
+        trace("GOT message %s %s", file, path)
+        self._shown = (file, path)
 
         try:
             hist = database.get_data(file, path)
-            ks = ["iters"] + hist.keys()
-
-            # Construct a Syntax object for the path in the message
-            table = Table(
-                *ks,
-            )
-
-            datas = [hist[k] for k in ks]
-            for i in range(len(hist)):
-                table.add_row(*[f"{d[i]}" for d in datas])
-
-            content = Panel(table, title=path)
+            if isinstance(hist, MpackArray):
+                content = await array_summary(hist, path)
+            elif np.isscalar(hist):
+                content = Align.center(Panel(Pretty(hist), title=path))
+            else:
+                content = HistoryRows(hist, path)
 
         except Exception:
             # Possibly a binary file
             # For demonstration purposes we will show the traceback
             content = Traceback(theme="monokai", width=None, show_locals=True)
 
-        panel = Align.center(content)
-
-        await self.update(panel)
+        await self.update(content, home=home)
 
     async def show_file(self, path) -> None:
         """A message sent by the directory tree when a file is clicked."""
 
-        log(f"GOT message (show file) {path}")
-        syntax: RenderableType
+        trace("GOT message (show file) %s", path)
+        self._shown = None
         try:
-            # Construct a Syntax object for the path in the message
-            syntax = Syntax.from_path(
-                path,
-                line_numbers=True,
-                word_wrap=True,
-                indent_guides=True,
-                theme="monokai",
-            )
+            content = FileLines(path)
         except Exception:
             # Possibly a binary file
             # For demonstration purposes we will show the traceback
-            syntax = Traceback(theme="monokai", width=None, show_locals=True)
+            content = Traceback(theme="monokai", width=None, show_locals=True)
 
-        await self.update(syntax)
+        await self.update(content)
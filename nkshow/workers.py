@@ -0,0 +1,11 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Worker processes are spawned rather than forked, as the watchdog thread
+# may hold locks meanwhile
+context = multiprocessing.get_context("spawn")
+
+
+def process_pool(max_workers):
+    """A ProcessPoolExecutor of `max_workers` spawned processes."""
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
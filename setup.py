@@ -1,6 +1,18 @@
 from setuptools import setup, find_packages
 
-BASE_DEPENDENCIES = ["numpy~=1.18", "netket", "rich", "textual", "pyfiglet", "watchdog"]
+# textual is pinned as the directory tree uses the internals of its TreeControl
+BASE_DEPENDENCIES = [
+    "numpy~=1.18",
+    "netket",
+    "rich",
+    "textual~=0.1.18",
+    # the plots are drawn on figures of their own, with plotext internals
+    "plotext~=5.0.2",
+    "pyfiglet",
+    "watchdog",
+]
+
+HDF5_DEPENDENCIES = ["h5py"]
 
 DEV_DEPENDENCIES = [
     "pytest>=6",
@@ -25,7 +37,7 @@ setup(
     packages=find_packages(),
     install_requires=BASE_DEPENDENCIES,
     python_requires=">=3.7",
-    extras_require={"dev": DEV_DEPENDENCIES},
+    extras_require={"dev": DEV_DEPENDENCIES, "hdf5": HDF5_DEPENDENCIES},
     entry_points={
         "console_scripts": [
             "nkshow = nkshow:run",
@@ -0,0 +1,16 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def write_log(tmp_path):
+    """Writes `data` as the json log `name` under tmp_path, returning its path."""
+
+    def write(data, name="run.log"):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data))
+        return str(path)
+
+    return write
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from nkshow.database.aggregate import Aggregate, column_stats
+from nkshow.database.history import History
+
+
+class FakeDatabase:
+    def __init__(self, runs):
+        self.runs = {}
+        self.versions = {}
+        for file, (iters, values) in runs.items():
+            self.set(file, iters, values)
+
+    def set(self, file, iters, values):
+        self.runs[file] = History({"Mean": np.asarray(values, dtype=float)}, iters=iters)
+        self.versions[file] = self.versions.get(file, 0) + 1
+
+    def version(self, file):
+        return self.versions[file]
+
+    def get_data(self, file, dict_path):
+        return self.runs[file]
+
+
+def reference(db, files):
+    agg = Aggregate(files, "Energy")
+    agg.update(db)
+    return agg
+
+
+def assert_same(agg, ref):
+    np.testing.assert_array_equal(agg.iters, ref.iters)
+    for k in ref.keys():
+        np.testing.assert_allclose(agg[k], ref[k], equal_nan=True)
+
+
+def test_column_stats():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(7, 30))
+    values[rng.random(values.shape) < 0.2] = np.nan
+    stats = column_stats(values, (0.25, 0.75))
+    with np.errstate(all="ignore"):
+        np.testing.assert_allclose(stats["mean"], np.nanmean(values, axis=0))
+        np.testing.assert_allclose(stats["std"], np.nanstd(values, axis=0))
+        np.testing.assert_allclose(stats["min"], np.nanmin(values, axis=0))
+        np.testing.assert_allclose(stats["q25"], np.nanquantile(values, 0.25, axis=0))
+        np.testing.assert_allclose(stats["q75"], np.nanquantile(values, 0.75, axis=0))
+
+
+def test_incremental_update():
+    files = ["a", "b", "c"]
+    db = FakeDatabase(
+        {
+            "a": (np.arange(10), np.arange(10)),
+            "b": (np.arange(6), np.arange(6) * 2),
+            "c": (np.arange(0, 10, 2), np.ones(5)),
+        }
+    )
+    agg = Aggregate(files, "Energy")
+    assert agg.update(db)
+    assert not agg.update(db)
+    assert_same(agg, reference(db, files))
+
+    # b grows into iterations that a already has, a beyond the others
+    db.set("b", np.arange(9), np.arange(9) * 2)
+    db.set("a", np.arange(14), np.arange(14))
+    assert agg.update(db)
+    assert_same(agg, reference(db, files))
+    assert len(agg) == 14
+
+    # rewritten run: rebuilt
+    db.set("c", np.arange(3), np.zeros(3))
+    agg.update(db)
+    assert_same(agg, reference(db, files))
+
+
+def test_bands_are_cached_per_version():
+    db = FakeDatabase({"a": (np.arange(4), np.arange(4)), "b": (np.arange(4), np.zeros(4))})
+    agg = Aggregate(["a", "b"], "Energy")
+    agg.update(db)
+    for kind in Aggregate.bands:
+        lower, upper = agg.band(kind)
+        assert agg.band(kind)[0] is lower
+        assert np.all(lower <= upper)
+    np.testing.assert_array_equal(agg.band("minmax")[1], np.arange(4))
+    assert agg["mean"] is agg["mean"]
+
+    mean = agg["mean"]
+    db.set("a", np.arange(5), np.arange(5))
+    agg.update(db)
+    assert agg["mean"] is not mean and len(agg["mean"]) == 5
+
+    with pytest.raises(ValueError):
+        agg.band("unknown")
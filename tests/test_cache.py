@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+
+from nkshow.database.cache import SidecarCache
+from nkshow.database.history import History
+from nkshow.database.loading import loadfile, loadtree
+
+
+LOG = {
+    "Energy": {
+        "iters": [0, 1, 2],
+        "Mean": {"real": [1.0, 0.5, 0.25], "imag": [0.0, 0.1, 0.0]},
+        "Sigma": [0.1, 0.1, 0.1],
+    },
+    "acceptance": {"iters": [0, 1, 2], "value": [0.5, 0.6, 0.7]},
+    "params": {"w": [1, 2, 3]},
+}
+
+
+def test_round_trip(tmp_path, write_log):
+    path = write_log(LOG)
+    cache = SidecarCache(str(tmp_path / "cache"), min_age=0)
+    data = loadfile(path)
+    assert cache.put(path, data)
+
+    cached = cache.get(path)
+    energy = cached["Energy"]
+    assert isinstance(energy, History)
+    assert energy.stats is not None
+    np.testing.assert_array_equal(energy["Mean"], data["Energy"]["Mean"])
+    np.testing.assert_array_equal(energy.iters, [0, 1, 2])
+    assert np.shares_memory(energy["Mean"], energy.stats.records)
+    np.testing.assert_array_equal(cached["acceptance"]["value"], [0.5, 0.6, 0.7])
+    np.testing.assert_array_equal(cached["params"]["w"], [1, 2, 3])
+
+
+def test_stale_entry(tmp_path, write_log):
+    path = write_log(LOG)
+    cache = SidecarCache(str(tmp_path / "cache"), min_age=0)
+    assert cache.put(path, loadfile(path))
+
+    with open(path, "a") as f:
+        f.write(" ")
+    assert cache.get(path) is None
+
+
+def test_lazy_tree_not_converted(tmp_path, write_log):
+    path = write_log(LOG)
+    cache = SidecarCache(str(tmp_path / "cache"), min_age=0)
+    tree = loadtree(path)
+
+    assert not cache.put(path, tree)
+    assert tree._cache == {}
+    assert not os.path.exists(cache.path)
+
+    tree["Energy"], tree["acceptance"]
+    assert not cache.put(path, tree)
+    tree["params"]["w"]
+    assert cache.put(path, tree)
+    assert set(cache.get(path).keys()) == set(LOG)
+
+
+def test_recent_files_not_cached(tmp_path, write_log):
+    path = write_log(LOG)
+    cache = SidecarCache(str(tmp_path / "cache"))
+    assert not cache.put(path, loadfile(path))
@@ -0,0 +1,170 @@
+import asyncio
+
+import numpy as np
+
+from nkshow.database.database import Database
+from nkshow.database.history import History
+
+
+def energy_log(n):
+    return {"Energy": {"iters": list(range(n)), "Mean": [float(i) for i in range(n)]}}
+
+
+def test_load_async(write_log):
+    path = write_log(energy_log(10))
+    database = Database(cache=None, watch=False)
+    progress = []
+
+    async def load():
+        try:
+            return await database.load_file_async(path, progress=progress.append)
+        finally:
+            database._executor.shutdown()
+
+    assert asyncio.run(load())
+    energy = database.get_data(path, "Energy")
+    assert isinstance(energy, History)
+    np.testing.assert_array_equal(energy["Mean"], np.arange(10.0))
+
+
+def test_manager_not_started_on_the_event_loop(write_log, monkeypatch):
+    import threading
+
+    from nkshow.database import database as module
+
+    threads = []
+    start = module.context.Manager
+
+    def manager():
+        threads.append(threading.current_thread())
+        return start()
+
+    monkeypatch.setattr(module.context, "Manager", manager)
+    path = write_log(energy_log(10))
+    database = Database(cache=None, watch=False)
+
+    async def load():
+        try:
+            return await asyncio.gather(database.load_file_async(path), database.load_file_async(path))
+        finally:
+            database._executor.shutdown()
+
+    assert asyncio.run(load()) == [True, True]
+    assert len(threads) == 1 and threads[0] is not threading.main_thread()
+
+
+def test_reload_async_appends(write_log):
+    path = write_log(energy_log(10))
+    database = Database(cache=None, watch=False)
+    database.load_file(path)
+    first = database.get_data(path, "Energy")
+
+    write_log(energy_log(20))
+    database.notify_dirty_file(path)
+
+    async def reload():
+        try:
+            return await database.load_file_async(path)
+        finally:
+            database._executor.shutdown()
+
+    assert asyncio.run(reload())
+    energy = database.get_data(path, "Energy")
+    np.testing.assert_array_equal(energy.iters, np.arange(20))
+    np.testing.assert_array_equal(energy["Mean"][:10], first["Mean"])
+
+
+def test_worker_timings_are_merged(write_log):
+    from nkshow import instrumentation
+
+    path = write_log(energy_log(10))
+    database = Database(cache=None, watch=False)
+
+    async def load():
+        try:
+            return await database.load_file_async(path)
+        finally:
+            database._executor.shutdown()
+
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        assert asyncio.run(load())
+        assert {"load_async", "parse"} <= set(instrumentation.stats)
+    finally:
+        instrumentation.enable(False)
+        instrumentation.reset()
+
+
+def open_logs(database, write_log, names, n=1000):
+    paths = {}
+    for name in names:
+        paths[name] = write_log(energy_log(n), f"{name}.log")
+        database.load_file(paths[name])
+        database.get_data(paths[name], "Energy")
+    return paths
+
+
+def test_eviction_is_lru(write_log):
+    # each log takes 2 * 8 * 1000 bytes once converted, and is counted as
+    # 64 kB of parsed json until then: the budget fits two and a new one
+    database = Database(cache=None, watch=False, memory_budget=90_000)
+    paths = open_logs(database, write_log, "ab")
+    assert database.memory_usage(paths["a"]) == 16_000
+    database.get_data(paths["a"], "Energy")
+
+    paths.update(open_logs(database, write_log, "c"))
+    assert not database.is_loaded(paths["b"])
+    assert database.is_loaded(paths["a"]) and database.is_loaded(paths["c"])
+    assert database.total_memory_usage() == 32_000
+
+    # evicted logs are loaded again when needed
+    energy = database.get_data(paths["b"], "Energy")
+    np.testing.assert_array_equal(energy["Mean"], np.arange(1000.0))
+    assert not database.is_loaded(paths["a"])
+
+
+def test_pinned_are_not_evicted(write_log):
+    database = Database(cache=None, watch=False, memory_budget=90_000)
+    paths = open_logs(database, write_log, "ab")
+    database.set_pinned([paths["a"]])
+    paths.update(open_logs(database, write_log, "cd"))
+    assert database.is_loaded(paths["a"]) and database.is_loaded(paths["d"])
+    assert not database.is_loaded(paths["b"]) and not database.is_loaded(paths["c"])
+
+    # over budget rather than evicting what is plotted
+    database.set_pinned(paths.values())
+    for path in paths.values():
+        database.get_data(path, "Energy")
+    assert all(database.is_loaded(path) for path in paths.values())
+    assert database.total_memory_usage() == 64_000
+
+
+def test_no_budget(write_log):
+    database = Database(cache=None, watch=False, memory_budget=None)
+    paths = open_logs(database, write_log, "abcd")
+    assert all(database.is_loaded(path) for path in paths.values())
+
+
+def test_aggregates_are_dropped(write_log):
+    database = Database(cache=None, watch=False, incremental=True)
+    paths = [write_log(energy_log(5), f"{name}.log") for name in "abc"]
+    for path in paths:
+        database.load_file(path)
+    ab = database.get_aggregate(paths[:2], "Energy")
+    bc = database.get_aggregate(paths[1:], "Energy")
+
+    # appended: followed incrementally
+    write_log(energy_log(8), "a.log")
+    database.notify_dirty_file(paths[0])
+    database.load_file(paths[0])
+    assert database.get_aggregate(paths[:2], "Energy") is ab and len(ab) == 8
+
+    database.retain_aggregates([(tuple(paths[:2]), "Energy", "Mean")])
+    assert database.get_aggregate(paths[1:], "Energy") is not bc
+
+    # loaded from scratch
+    database.incremental = False
+    database.notify_dirty_file(paths[0])
+    database.load_file(paths[0])
+    assert database.get_aggregate(paths[:2], "Energy") is not ab
@@ -0,0 +1,54 @@
+import asyncio
+import os
+
+from nkshow.database import Database, KeyIndex
+from nkshow.database.index import summarize
+from nkshow.widgets import directory_tree
+from nkshow.widgets.directory_tree import DirEntry, DirectoryTree, FileEntry, JsonEntry, sort_key
+
+
+def test_plotted_markers_survive_the_filter(tmp_path, write_log, monkeypatch):
+    a = write_log({"Energy": {"iters": [0], "Mean": [1.0]}}, "a.log")
+    write_log({"Other": {"iters": [0], "Mean": [1.0]}}, "b.log")
+    index = KeyIndex(str(tmp_path / "index.sqlite"))
+    st = os.stat(a)
+    index.update(a, summarize(a), (st.st_size, st.st_mtime_ns))
+    monkeypatch.setattr(directory_tree, "key_index", index)
+    monkeypatch.setattr(directory_tree, "database", Database(cache=None, watch=False))
+
+    def child(node, label):
+        (found,) = [c for c in node.children if c.label == label]
+        return found
+
+    async def main():
+        tree = DirectoryTree(str(tmp_path))
+        posted = []
+
+        async def post_message(message):
+            posted.append(message)
+
+        tree.post_message = post_message
+        await tree.load_directory(tree.root)
+        file = child(tree.root, "a.log")
+        await tree.load_obj(file)
+        energy = child(file, "Energy")
+        assert isinstance(energy.data, JsonEntry)
+        await tree.action_click_btn(energy.id)
+        assert tree._is_fixed(energy) and posted[-1].fix
+
+        assert await tree.set_filter("Energy") == 1
+        assert [c.label for c in tree.root.children] == ["a.log"]
+        await tree.set_filter(None)
+
+        file = child(tree.root, "a.log")
+        await tree.load_obj(file)
+        assert tree._is_fixed(child(file, "Energy"))
+
+    asyncio.run(main())
+    index.close()
+
+
+def test_logs_are_listed_first():
+    entries = [DirEntry("runs"), FileEntry("notes.txt"), FileEntry("b.h5"), FileEntry("a.log")]
+    assert [e.path for e in sorted(entries, key=sort_key)] == ["a.log", "b.h5", "runs", "notes.txt"]
+    assert FileEntry("b.h5").type == FileEntry("a.json").type == 0
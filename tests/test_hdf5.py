@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+h5py = pytest.importorskip("h5py")
+
+from nkshow.database.hdf5 import H5Tree, LazyDataset, loadh5
+from nkshow.database.history import History
+from nkshow.database.loading import tree_nbytes
+from nkshow.widgets.plot import PlotextMixin
+
+
+N = 10_000
+
+
+@pytest.fixture
+def log(tmp_path):
+    path = str(tmp_path / "run.h5")
+    with h5py.File(path, "w") as f:
+        energy = f.create_group("Energy")
+        energy["iters"] = np.arange(N)
+        energy["Mean"] = np.sin(np.arange(N) / 100)
+        # chunked and compressed datasets cannot be memory mapped
+        energy.create_dataset("Sigma", data=np.ones(N), chunks=(1000,), compression="gzip")
+        f["params/w"] = np.arange(6.0).reshape(2, 3)
+    return path
+
+
+def test_metadata_only(log):
+    tree = loadh5(log)
+    assert isinstance(tree, H5Tree)
+    assert tree.keys() == ["Energy", "params"]
+    assert tree.is_branch("params") and not tree.is_branch("Energy")
+
+    energy = tree["Energy"]
+    assert isinstance(energy, History)
+    assert isinstance(energy["Mean"], np.memmap)
+    assert isinstance(energy["Sigma"], LazyDataset)
+    np.testing.assert_array_equal(tree["params"]["w"], np.arange(6.0).reshape(2, 3))
+    assert tree_nbytes(tree) == 0
+
+
+def test_lazy_dataset_slices(log):
+    sigma = loadh5(log)["Energy"]["Sigma"]
+    assert len(sigma) == N and sigma.shape == (N,)
+    np.testing.assert_array_equal(sigma[10:20], np.ones(10))
+    assert sigma.nbytes == 0
+
+    np.testing.assert_array_equal(np.asarray(sigma), np.ones(N))
+    assert sigma.nbytes == N * 8
+
+
+def test_plot_reads_only_the_visible_slice(log):
+    energy = loadh5(log)["Energy"]
+    sigma = energy["Sigma"]
+    plot = PlotextMixin()
+    plot.data = [(energy.iters, sigma, "Sigma")]
+    plot.xlim = (100, 199)
+
+    spec = plot.plot_spec(40, 20)
+    (x, y, _), = spec["series"]
+    assert x.min() >= 100 and x.max() <= 199
+    np.testing.assert_array_equal(y, 1.0)
+    assert sigma.nbytes == 0
@@ -0,0 +1,59 @@
+import pickle
+
+import numpy as np
+
+from nkshow.database.history import History
+from nkshow.database.loading import tree_nbytes
+from nkshow.database.stats import StatsArray
+
+
+def stats_history(n):
+    columns = {"Mean": np.arange(n, dtype=float), "Sigma": np.ones(n), "Variance": np.ones(n)}
+    return History.from_stats(StatsArray.from_columns(columns), np.arange(n), columns.keys())
+
+
+def test_append():
+    a = History({"value": np.arange(3.0)}, iters=np.arange(3))
+    b = History({"value": np.arange(3.0, 5.0)}, iters=np.arange(3, 5))
+    c = a.append(b)
+    np.testing.assert_array_equal(c.iters, np.arange(5))
+    np.testing.assert_array_equal(c["value"], np.arange(5.0))
+    assert c.value is c["value"]
+
+
+def test_append_stats():
+    h = stats_history(3).append(stats_history(2))
+    assert h.stats is not None and len(h.stats) == 5
+    assert np.shares_memory(h["Mean"], h.stats.records)
+
+
+def test_pickle_keeps_views():
+    h = stats_history(200_000)
+    data = pickle.dumps(h)
+    assert len(data) < 1.2 * h.stats.records.nbytes + h.iters.nbytes
+
+    h2 = pickle.loads(data)
+    assert h2.keys() == h.keys()
+    assert np.shares_memory(h2["Mean"], h2.stats.column("Mean"))
+    np.testing.assert_array_equal(h2["Sigma"], h["Sigma"])
+    assert tree_nbytes(h2) == h2.iters.nbytes + h2.stats.records.nbytes
+
+
+def test_pickle_plain():
+    h = History({"value": np.arange(3.0)}, iters=np.arange(3))
+    h2 = pickle.loads(pickle.dumps(h))
+    np.testing.assert_array_equal(h2["value"], h["value"])
+    assert h2.stats is None
+
+
+def test_partial_stats_block():
+    n = 10_000
+    columns = {"Mean": np.arange(n, dtype=float), "Sigma": np.ones(n)}
+    stats = StatsArray.from_columns(columns)
+    assert stats.records.nbytes == 2 * 8 * n
+    assert stats.variance is None and np.isnan(stats[3].tau)
+    assert stats[3].err == 1.0
+
+    mean_only = StatsArray.from_columns({"Mean": np.arange(n) + 1j})
+    assert mean_only.records.nbytes == 16 * n
+    assert mean_only.band() is None
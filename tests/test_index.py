@@ -0,0 +1,67 @@
+import asyncio
+import os
+
+import nkshow.database
+from nkshow import instrumentation
+from nkshow.database import index as module
+from nkshow.database.index import IndexBuilder, KeyIndex, escape, summarize
+
+
+def test_module_not_shadowed():
+    assert not isinstance(nkshow.database.index, KeyIndex)
+    assert isinstance(nkshow.database.key_index, KeyIndex)
+
+
+def test_summarize(write_log):
+    path = write_log(
+        {"Energy": {"iters": [0, 5, 10], "Mean": [1.0, 2.0, 3.0]}, "params": {"w": [1, 2]}},
+    )
+    assert summarize(path) == {"Energy": (3, 10), "params/w": (2, None)}
+
+
+def test_index(tmp_path, write_log):
+    a = write_log({"Energy": {"iters": [0], "Mean": [1.0]}}, "a.log")
+    b = write_log({"obs[1]": {"iters": [0], "Mean": [1.0]}}, "sub/b.log")
+
+    index = KeyIndex(str(tmp_path / "index.sqlite"))
+    for path in (a, b):
+        st = os.stat(path)
+        index.update(path, summarize(path), (st.st_size, st.st_mtime_ns))
+
+    assert index.is_current(a)
+    assert index.files_with("Energy") == {os.path.abspath(a)}
+    assert index.files_with(escape("obs[1]")) == {os.path.abspath(b)}
+    assert index.files_with("*", root=str(tmp_path / "sub")) == {os.path.abspath(b)}
+    assert index.has_key(a, "Energy") and not index.has_key(a, "obs*")
+
+    with open(a, "a") as f:
+        f.write(" ")
+    assert not index.is_current(a)
+
+    index.remove(str(tmp_path / "sub"))
+    assert index.keys() == ["Energy"]
+    index.close()
+
+
+def test_builder_failure_is_reported(tmp_path, write_log, monkeypatch):
+    class BrokenPool:
+        def submit(self, *args):
+            raise RuntimeError("broken pool")
+
+        def shutdown(self, wait=True):
+            pass
+
+    logged = []
+    monkeypatch.setattr(instrumentation, "_log", logged.append)
+    monkeypatch.setattr(module, "process_pool", lambda max_workers: BrokenPool())
+    builder = IndexBuilder(KeyIndex(str(tmp_path / "index.sqlite")), min_interval=0)
+    builder.queue(write_log({"Energy": {"iters": [0], "Mean": [1.0]}}))
+
+    async def main():
+        builder.start()
+        await asyncio.wait_for(builder._task, 5)
+
+    asyncio.run(main())
+    assert "broken pool" in builder.failed
+    assert any("broken pool" in line for line in logged)
+    builder.index.close()
@@ -0,0 +1,52 @@
+import numpy as np
+
+from nkshow.database.history import History
+from nkshow.database.loading import LazyTree, loadtree, reloadfile
+
+
+def test_loadtree_is_lazy(write_log):
+    path = write_log(
+        {"Energy": {"iters": [0, 1, 2], "Mean": [1.0, 0.5, 0.25]}, "x": {"y": [1, 2]}},
+    )
+    tree = loadtree(path)
+    assert isinstance(tree, LazyTree)
+    assert tree._cache == {}
+    assert tree.is_branch("x") and not tree.is_branch("Energy")
+
+    energy = tree["Energy"]
+    assert isinstance(energy, History)
+    np.testing.assert_array_equal(energy.iters, [0, 1, 2])
+    np.testing.assert_array_equal(energy["Mean"], [1.0, 0.5, 0.25])
+    assert list(tree._cache) == ["Energy"]
+
+
+def test_loadtree_root_history(write_log):
+    path = write_log({"iters": [0, 1], "Mean": [1.0, 2.0]})
+    hist = loadtree(path)
+    assert isinstance(hist, History)
+    np.testing.assert_array_equal(hist["Mean"], [1.0, 2.0])
+
+
+def test_reload_appends(write_log):
+    log = write_log({"Energy": {"iters": [0, 1], "Mean": [1.0, 2.0]}})
+    tree = loadtree(log)
+    first = tree["Energy"]
+
+    write_log({"Energy": {"iters": [0, 1, 2], "Mean": [1.0, 2.0, 3.0]}})
+    tree = reloadfile(log, tree)
+    np.testing.assert_array_equal(tree["Energy"].iters, [0, 1, 2])
+    np.testing.assert_array_equal(tree["Energy"]["Mean"][:2], first["Mean"])
+
+    # rewritten: converted from scratch
+    write_log({"Energy": {"iters": [5], "Mean": [7.0]}})
+    tree = reloadfile(log, tree)
+    np.testing.assert_array_equal(tree["Energy"]["Mean"], [7.0])
+
+
+def test_reload_root_history(write_log):
+    log = write_log({"iters": [0], "Mean": [1.0]})
+    hist = loadtree(log)
+    write_log({"iters": [0, 1], "Mean": [1.0, 2.0]})
+    hist = reloadfile(log, hist)
+    assert isinstance(hist, History)
+    np.testing.assert_array_equal(hist["Mean"], [1.0, 2.0])
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+msgpack = pytest.importorskip("msgpack")
+
+from nkshow.database.mpack import MpackArray, MpackError, loadmpack, payload_nbytes
+
+
+def ndarray(x):
+    # as flax.serialization._ndarray_to_bytes
+    data = msgpack.packb((x.shape, x.dtype.name, x.tobytes("C")), use_bin_type=True)
+    return msgpack.ExtType(1, data)
+
+
+def chunked(x, n_chunks):
+    # as flax.serialization._chunk_array_leaves_in_place
+    flat = x.reshape(-1)
+    chunks = np.array_split(flat, n_chunks)
+    return {
+        "__msgpack_chunked_array__": True,
+        "shape": {str(i): d for i, d in enumerate(x.shape)},
+        "chunks": {str(i): ndarray(c) for i, c in enumerate(chunks)},
+    }
+
+
+def write(tmp_path, tree):
+    path = tmp_path / "state.mpack"
+    path.write_bytes(msgpack.packb(tree, use_bin_type=True))
+    return str(path)
+
+
+def test_arrays_are_not_read(tmp_path):
+    w = np.arange(12.0).reshape(3, 4)
+    path = write(
+        tmp_path,
+        {
+            "params": {"w": ndarray(w), "b": ndarray(np.array([1 + 2j, 3j]))},
+            "step": 7,
+            "scalar": msgpack.ExtType(3, msgpack.packb(((), "float64", np.float64(2.5).tobytes()))),
+            "layers": [ndarray(np.zeros(2)), ndarray(np.ones(2))],
+        },
+    )
+    tree = loadmpack(path)
+    arr = tree["params"]["w"]
+    assert isinstance(arr, MpackArray)
+    assert arr.shape == (3, 4) and arr.dtype == "float64" and arr.nbytes == w.nbytes
+    np.testing.assert_array_equal(np.asarray(arr), w)
+    np.testing.assert_array_equal(np.asarray(tree["params"]["b"]), [1 + 2j, 3j])
+    assert tree["step"] == 7
+    assert tree["scalar"] == 2.5
+    np.testing.assert_array_equal(np.asarray(tree["layers"]["1"]), np.ones(2))
+    assert payload_nbytes(tree) == w.nbytes + 32 + 32
+
+
+def test_chunked_array(tmp_path):
+    x = np.arange(60, dtype=np.float32).reshape(3, 4, 5)
+    tree = loadmpack(write(tmp_path, {"big": chunked(x, 4)}))
+    arr = tree["big"]
+    assert arr.shape == (3, 4, 5)
+    assert arr.size == 60 and len(arr.segments) == 4
+    np.testing.assert_array_equal(np.asarray(arr), x)
+    assert arr.stats()["max"] == 59
+
+
+def test_stats(tmp_path):
+    x = np.array([1.0, np.nan, 3.0, -2.0])
+    stats = loadmpack(write(tmp_path, {"x": ndarray(x)}))["x"].stats(chunk_size=16)
+    valid = x[~np.isnan(x)]
+    assert stats["count"] == 3 and stats["nans"] == 1
+    assert stats["mean"] == pytest.approx(valid.mean())
+    assert stats["std"] == pytest.approx(valid.std())
+    assert stats["norm"] == pytest.approx(np.linalg.norm(valid))
+    assert (stats["min"], stats["max"]) == (-2.0, 3.0)
+
+
+def test_truncated(tmp_path):
+    path = write(tmp_path, {"x": ndarray(np.zeros(100))})
+    with open(path, "rb+") as f:
+        f.truncate(50)
+    with pytest.raises(MpackError):
+        loadmpack(path)
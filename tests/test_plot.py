@@ -0,0 +1,91 @@
+import subprocess
+import sys
+
+import numpy as np
+
+from nkshow import canvas
+from nkshow.canvas import build_canvas, render_lines
+from nkshow.widgets.downsample import MinMaxPyramid, minmax_indices
+from nkshow.widgets.plot import PlotextMixin
+
+
+def spec():
+    x = np.arange(100)
+    return dict(series=[(x, np.sin(x / 10), "sin")], bands=[(x, np.zeros(100))], width=60, height=15)
+
+
+def test_build_canvas():
+    canvas = build_canvas(**spec())
+    assert len(canvas.splitlines()) == 15
+    assert len(render_lines(spec())) == 15
+
+
+def test_build_canvas_global_figure(monkeypatch):
+    monkeypatch.setattr(canvas, "_figure_class", None)
+    assert len(render_lines(spec())) == 15
+
+
+def test_render_workers_do_not_watch_files():
+    # what a worker of the render pool imports to unpickle render_lines
+    code = "import sys, nkshow.canvas; assert 'nkshow.filewatching' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_pyramid_matches_minmax():
+    rng = np.random.default_rng(0)
+    y = rng.normal(size=10_000)
+    y[rng.random(10_000) < 0.01] = np.nan
+    pyramid = MinMaxPyramid(y)
+    for start, stop in [(0, 10_000), (123, 4567), (5000, 5100)]:
+        idx = pyramid.indices(50, start, stop)
+        assert np.all((idx >= start) & (idx < stop))
+        # the extremes of the range are always kept
+        window = y[start:stop]
+        assert np.nanmax(y[idx]) == np.nanmax(window)
+        assert np.nanmin(y[idx]) == np.nanmin(window)
+        ref = minmax_indices(y, 50, start, stop)
+        assert np.nanmax(y[ref]) == np.nanmax(window)
+
+
+def test_plot_spec_reuses_pyramids():
+    x = np.arange(1000)
+    y = np.cos(x / 50)
+    p = PlotextMixin()
+    p.data = [(x, y, "cos")]
+    p.plot_spec(40, 10)
+    pyramid = p._pyramids["cos"][1]
+    p.xlim = (100, 300)
+    (xs, _, _), = p.plot_spec(40, 10)["series"]
+    assert p._pyramids["cos"][1] is pyramid
+    assert xs.min() >= 100 and xs.max() <= 300
+
+
+def test_canvas_key_follows_aggregates(write_log, monkeypatch):
+    import asyncio
+
+    from nkshow.database import Database
+    from nkshow.widgets import plot_panel
+
+    db = Database(cache=False, watch=False)
+    monkeypatch.setattr(plot_panel, "database", db)
+    files = {}
+    for name, offset in (("a", 0), ("b", 1), ("c", 2), ("d", 3)):
+        files[name] = write_log({"Energy": {"iters": [0, 1, 2], "Mean": [offset] * 3}}, f"{name}.log")
+        db.load_file(files[name])
+
+    async def key(runs, band):
+        panel.aggregate_band = band
+        panel._plot_keys_fixed = [(files[r], "Energy", ("iters", "Mean")) for r in runs]
+        await panel.update_plot()
+        return panel._plot.canvas_key(60, 15)
+
+    async def main():
+        first = await key("abc", "quantiles")
+        assert await key("abc", "quantiles") == first
+        assert await key("abc", "minmax") != first
+        # same versions and labels, other runs
+        assert await key("abd", "quantiles") != first
+
+    panel = plot_panel.PlotPanel(name="plot")
+    panel.aggregate = True
+    asyncio.run(main())
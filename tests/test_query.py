@@ -0,0 +1,65 @@
+import json
+import os
+
+import numpy as np
+
+from nkshow.query import expand_paths, main
+
+
+def energy_log(n, offset=0.0):
+    return {
+        "Energy": {
+            "iters": list(range(n)),
+            "Mean": {"real": [offset + i for i in range(n)], "imag": [0.5] * n},
+            "Sigma": [0.1] * n,
+        }
+    }
+
+
+def test_expand_paths(tmp_path, write_log):
+    a = write_log(energy_log(1), "a.log")
+    b = write_log(energy_log(1), "sub/b.log")
+    os.mkdir(tmp_path / "dir.log")
+    pattern = str(tmp_path / "**" / "*.log")
+    missing = str(tmp_path / "missing.log")
+    assert expand_paths([b, pattern, missing]) == [b, a, missing]
+
+
+def test_csv(tmp_path, write_log, capsysbinary):
+    a = write_log(energy_log(3), "a.log")
+    b = write_log(energy_log(2, offset=10), "b.log")
+    assert main([a, b, "Energy", "--no-cache", "-j", "2"]) == 0
+    lines = capsysbinary.readouterr().out.decode().splitlines()
+    assert lines[0] == "file,iters,Mean.real,Mean.imag,Sigma"
+    assert len(lines) == 1 + 3 + 2
+    assert lines[1].split(",")[:3] == [f'"{a}"', "0", "0.0"]
+    assert lines[-1].split(",")[:3] == [f'"{b}"', "1", "11.0"]
+
+
+def test_json(tmp_path, write_log):
+    a = write_log(energy_log(3), "a.log")
+    out = tmp_path / "out.jsonl"
+    assert main([a, "Energy/Mean", "--format", "json", "-o", str(out), "--no-cache", "-j", "1"]) == 0
+    (record,) = [json.loads(line) for line in out.read_text().splitlines()]
+    assert record["file"] == a
+    assert record["value"] == {"real": [0.0, 1.0, 2.0], "imag": [0.5, 0.5, 0.5]}
+
+
+def test_npy(tmp_path, write_log, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_log(energy_log(4), "runs/a.log")
+    assert main(["runs/*.log", "Energy", "--format", "npy", "-o", "out", "--no-cache", "-j", "1"]) == 0
+    records = np.load(tmp_path / "out" / "runs" / "a.log.npy")
+    assert records.dtype.names == ("iters", "Mean", "Sigma")
+    np.testing.assert_array_equal(records["Mean"], np.arange(4) + 0.5j)
+
+
+def test_errors_exit_nonzero(tmp_path, write_log, capsysbinary):
+    a = write_log(energy_log(2), "a.log")
+    missing = str(tmp_path / "missing.log")
+    assert main([a, missing, "Energy", "--no-cache", "-j", "1"]) == 1
+    captured = capsysbinary.readouterr()
+    assert missing in captured.err.decode()
+    assert len(captured.out.decode().splitlines()) == 1 + 2
+
+    assert main([a, "Nothing", "--no-cache", "-j", "1"]) == 1
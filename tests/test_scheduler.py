@@ -0,0 +1,38 @@
+import asyncio
+
+from nkshow import instrumentation
+from nkshow.widgets.scheduler import RedrawScheduler
+
+
+def test_coalesces_requests():
+    calls = []
+
+    async def main():
+        scheduler = RedrawScheduler(fps=100)
+        scheduler.attach()
+        for i in range(5):
+            scheduler.request("plot", lambda i=i: calls.append(i))
+        await asyncio.sleep(0.1)
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert calls == [4]
+    assert scheduler.dropped == 4 and scheduler.frames == 1
+
+
+def test_errors_are_logged(monkeypatch):
+    logged = []
+    monkeypatch.setattr(instrumentation, "_log", logged.append)
+
+    def broken():
+        raise RuntimeError("broken widget")
+
+    async def main():
+        scheduler = RedrawScheduler(fps=100)
+        scheduler.request("a", broken)
+        scheduler.request("b", lambda: logged.append("b ran"))
+        await asyncio.sleep(0.1)
+
+    asyncio.run(main())
+    assert any("broken widget" in line for line in logged)
+    assert "b ran" in logged
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from nkshow.database.aggregate import Aggregate
+from nkshow.database.history import History
+from nkshow.database.smoothing import Rolling, Smoothing
+
+
+def reference(x, window):
+    # one point at a time, as pandas' rolling(window, min_periods=1) and
+    # ewm(span=window, ignore_na=True) over the valid values
+    mean, var, ema = [], [], []
+    alpha = 2 / (window + 1)
+    y = np.nan
+    for i, xi in enumerate(x):
+        w = x[max(0, i + 1 - window) : i + 1]
+        w = w[~np.isnan(w)]
+        mean.append(w.mean() if len(w) else np.nan)
+        var.append(w.var() if len(w) else np.nan)
+        if not np.isnan(xi):
+            y = xi if np.isnan(y) else alpha * xi + (1 - alpha) * y
+        ema.append(y)
+    return np.array(mean), np.array(var), np.array(ema)
+
+
+def series(n=3000, seed=0):
+    x = 1e6 + np.random.default_rng(seed).normal(size=n)
+    x[[i for i in (0, 5, 100, 2000) if i < n]] = np.nan
+    return x
+
+
+@pytest.mark.parametrize("window", [2, 7, 50, 1000])
+def test_incremental_matches_reference(window):
+    x = series()
+    r = Rolling(window)
+    for stop in (1, 10, 1500, 1501, 3000):
+        r.update(x[:stop])
+    mean, var, ema = reference(x, window)
+    np.testing.assert_allclose(r.mean, mean, rtol=0, atol=1e-8, equal_nan=True)
+    np.testing.assert_allclose(r.var, var, rtol=0, atol=1e-6, equal_nan=True)
+    np.testing.assert_allclose(r.ema, ema, rtol=0, atol=1e-8, equal_nan=True)
+
+
+def test_rewritten_and_truncated():
+    x = series(200)
+    r = Rolling(5).update(x[:100])
+    y = x.copy()
+    y[99] = 0.0
+    r.update(y)
+    np.testing.assert_allclose(r.mean, reference(y, 5)[0], equal_nan=True)
+
+    r.update(x[:50])
+    assert len(r) == 50
+    np.testing.assert_allclose(r.ema, reference(x[:50], 5)[2], equal_nan=True)
+
+    r.truncate(20)
+    r.update(y)
+    np.testing.assert_allclose(r.mean, reference(y, 5)[0], equal_nan=True)
+
+
+def test_complex_uses_real_part():
+    r = Rolling(3).update(np.arange(5) + 1j)
+    assert r.mean[-1] == 3
+
+
+def test_arrays_are_cached_until_changed():
+    x = series(100)
+    s = Smoothing(window=10)
+    s.mode = "mean"
+    y, band = s.apply("k", x[:50])
+    y2, band2 = s.apply("k", x[:50])
+    assert y2 is y and band2 is band
+    y3, _ = s.apply("k", x)
+    assert y3 is not y and len(y3) == 100
+    np.testing.assert_array_equal(y3[:50], y)
+
+    s.mode = "ema"
+    assert s.apply("k", x)[0] is s.apply("k", x)[0]
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.runs = {}
+        self.versions = {}
+
+    def set(self, file, values):
+        self.runs[file] = History({"Mean": np.asarray(values, dtype=float)}, iters=np.arange(len(values)))
+        self.versions[file] = self.versions.get(file, 0) + 1
+
+    def version(self, file):
+        return self.versions[file]
+
+    def get_data(self, file, dict_path):
+        return self.runs[file]
+
+
+def test_aggregate_changes_before_its_end():
+    db = FakeDatabase()
+    db.set("a", np.arange(10.0))
+    db.set("b", np.zeros(4))
+    agg = Aggregate(["a", "b"], "Energy")
+    agg.update(db)
+
+    s = Smoothing(window=3)
+    s.mode = "mean"
+    s.apply("agg", agg["mean"], source=agg)
+
+    # b grows: the means of iterations 4 to 7 change, not only the new ones
+    db.set("b", np.zeros(8))
+    agg.update(db)
+    assert agg.unchanged_since(agg.version - 1) == 4
+    y, _ = s.apply("agg", agg["mean"], source=agg)
+    np.testing.assert_allclose(y, reference(np.asarray(agg["mean"]), 3)[0])
+
+
+def test_retain():
+    s = Smoothing()
+    s.mode = "mean"
+    s.apply("a", np.ones(5))
+    s.apply("b", np.ones(5))
+    s.retain(["b"])
+    assert list(s._series) == ["b"]
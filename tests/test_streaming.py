@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from nkshow.database.history import History
+from nkshow.database.loading import loadfile
+from nkshow.database.streaming import ColumnBuffer, StreamingUnsupported, loadstream
+
+
+LOG = {
+    "Energy": {
+        "iters": list(range(50)),
+        "Mean": {"real": [0.5 * i for i in range(50)], "imag": [1e-3] * 50},
+        "Sigma": [0.1] * 50,
+    },
+    "counts": {"iters": [0, 1, 2, 3], "value": [1, None, 3, 4]},
+    "flags": {"iters": [0, 1, 2], "ok": [True, None, False]},
+    "key with \"quotes\"": {"x": [1.5, 2.5]},
+}
+
+
+def assert_same_tree(a, b):
+    if isinstance(b, History):
+        assert isinstance(a, History)
+        assert set(a.keys()) == set(b.keys())
+        np.testing.assert_array_equal(a.iters, b.iters)
+        for k in b.keys():
+            np.testing.assert_array_equal(a[k], b[k])
+    elif isinstance(b, dict):
+        assert set(a.keys()) == set(b.keys())
+        for k in b:
+            assert_same_tree(a[k], b[k])
+    else:
+        np.testing.assert_array_equal(a, b)
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 2 ** 22])
+def test_same_as_loadfile(write_log, chunk_size):
+    path = write_log(LOG)
+    assert_same_tree(loadstream(path, chunk_size=chunk_size), loadfile(path))
+
+
+def test_gaps(write_log):
+    data = loadstream(write_log(LOG), chunk_size=16)
+    np.testing.assert_array_equal(data["counts"]["value"], [1, np.nan, 3, 4])
+    np.testing.assert_array_equal(data["flags"]["ok"], [1, np.nan, 0])
+
+
+def test_truncated(write_log):
+    path = write_log(LOG)
+    with open(path, "rb+") as f:
+        f.truncate(100)
+    with pytest.raises(StreamingUnsupported):
+        loadstream(path, chunk_size=16)
+
+
+def test_unsupported_layout(write_log):
+    with pytest.raises(StreamingUnsupported):
+        loadstream(write_log({"a": "string"}))
+    with pytest.raises(StreamingUnsupported):
+        loadstream(write_log([1, 2, 3]))
+
+
+def test_column_buffer_promotes():
+    buf = ColumnBuffer(capacity=2)
+    buf.append(np.array([1, 2, 3]))
+    buf.append(np.array([np.nan]))
+    np.testing.assert_array_equal(buf.values, [1, 2, 3, np.nan])
+    out = buf.finish()
+    assert out.dtype == np.float64 and len(out) == 4
@@ -0,0 +1,53 @@
+import os
+import time
+
+from watchdog.events import FileModifiedEvent, FileMovedEvent
+
+from nkshow.filewatching.watch_manager import WatchManager
+
+
+class FakeObserver:
+    def __init__(self):
+        self.handlers = {}
+
+    def schedule(self, handler, directory, recursive):
+        self.handlers[directory] = handler
+        return directory
+
+    def unschedule(self, watch):
+        del self.handlers[watch]
+
+
+def test_bursts_are_coalesced(tmp_path):
+    observer = FakeObserver()
+    manager = WatchManager(observer, interval=0.3)
+    calls = []
+    a, b = str(tmp_path / "a.log"), str(tmp_path / "b.log")
+    for path in (a, b):
+        manager.watch_file(path, calls.append)
+    # one watch for the directory of both
+    (handler,) = observer.handlers.values()
+
+    for _ in range(10):
+        handler.dispatch(FileModifiedEvent(a))
+        handler.dispatch(FileModifiedEvent(b))
+    handler.dispatch(FileMovedEvent(str(tmp_path / "a.log.tmp"), a))
+    handler.dispatch(FileModifiedEvent(str(tmp_path / "other.log")))
+    # the first event is delivered right away, the others at the end of the interval
+    assert sorted(calls) == [a, b]
+
+    time.sleep(0.5)
+    assert sorted(calls) == [a, a, b, b]
+    time.sleep(0.4)
+    assert len(calls) == 4
+
+    # delivered right away, then pending until dropped with the watch
+    handler.dispatch(FileModifiedEvent(a))
+    handler.dispatch(FileModifiedEvent(a))
+    manager.unwatch_file(a)
+    time.sleep(0.5)
+    assert calls.count(a) == 3
+
+    manager.unwatch_file(b)
+    assert observer.handlers == {}
+    assert not manager.is_watched(os.path.abspath(b))